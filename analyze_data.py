@@ -21,6 +21,12 @@ def analyze_shipment_logic(data_path: str = "data"):
     loader = DataLoader(data_path)
     data = loader.load_all_data()
     
+    # Категориальные коды продуктов и складов ускоряют groupby и isin
+    for df in data.values():
+        for col in ('unified_code', 'warehouse'):
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+    
     shipment_calc = ShipmentCalculator()
     
     # Анализ для Wildberries
@@ -32,11 +38,15 @@ def analyze_shipment_logic(data_path: str = "data"):
         wb_sales = data['wb_sales']
         wb_stocks = data['wb_stocks']
         
+        # Агрегаты по датам и продуктам считаем один раз
+        sales_per_date = wb_sales.groupby('date', sort=False)['quantity'].sum()
+        sales_per_code = wb_sales.groupby('unified_code', sort=False, observed=True)['quantity'].sum()
+        
         print(f"\nПродажи:")
         print(f"  Период: {wb_sales['date'].min()} - {wb_sales['date'].max()}")
-        print(f"  Уникальных продуктов: {wb_sales['unified_code'].nunique()}")
+        print(f"  Уникальных продуктов: {len(sales_per_code)}")
         print(f"  Всего записей: {len(wb_sales)}")
-        print(f"  Средние продажи в день: {wb_sales.groupby('date')['quantity'].sum().mean():.2f}")
+        print(f"  Средние продажи в день: {sales_per_date.mean():.2f}")
         
         print(f"\nОстатки:")
         print(f"  Период: {wb_stocks['date'].min()} - {wb_stocks['date'].max()}")
@@ -58,14 +68,14 @@ def analyze_shipment_logic(data_path: str = "data"):
         
         # Анализ по продуктам
         print(f"\nТоп-10 продуктов по продажам:")
-        top_products = wb_sales.groupby('unified_code')['quantity'].sum().sort_values(ascending=False).head(10)
+        top_products = sales_per_code.nlargest(10)
         for product, sales in top_products.items():
             print(f"  {product}: {sales:.0f}")
         
         # Анализ по складам
         if 'warehouse' in wb_stocks.columns:
             print(f"\nРаспределение остатков по складам:")
-            warehouse_stocks = wb_stocks.groupby('warehouse')['stock'].sum().sort_values(ascending=False)
+            warehouse_stocks = wb_stocks.groupby('warehouse', observed=True)['stock'].sum().sort_values(ascending=False)
             for warehouse, stock in warehouse_stocks.items():
                 print(f"  {warehouse}: {stock:.0f}")
     
@@ -78,11 +88,15 @@ def analyze_shipment_logic(data_path: str = "data"):
         ozon_sales = data['ozon_sales']
         ozon_stocks = data['ozon_stocks']
         
+        # Агрегаты по датам и продуктам считаем один раз
+        sales_per_date = ozon_sales.groupby('date', sort=False)['quantity'].sum()
+        sales_per_code = ozon_sales.groupby('unified_code', sort=False, observed=True)['quantity'].sum()
+        
         print(f"\nПродажи:")
         print(f"  Период: {ozon_sales['date'].min()} - {ozon_sales['date'].max()}")
-        print(f"  Уникальных продуктов: {ozon_sales['unified_code'].nunique()}")
+        print(f"  Уникальных продуктов: {len(sales_per_code)}")
         print(f"  Всего записей: {len(ozon_sales)}")
-        print(f"  Средние продажи в день: {ozon_sales.groupby('date')['quantity'].sum().mean():.2f}")
+        print(f"  Средние продажи в день: {sales_per_date.mean():.2f}")
         
         print(f"\nОстатки:")
         print(f"  Период: {ozon_stocks['date'].min()} - {ozon_stocks['date'].max()}")
@@ -104,14 +118,14 @@ def analyze_shipment_logic(data_path: str = "data"):
         
         # Анализ по продуктам
         print(f"\nТоп-10 продуктов по продажам:")
-        top_products = ozon_sales.groupby('unified_code')['quantity'].sum().sort_values(ascending=False).head(10)
+        top_products = sales_per_code.nlargest(10)
         for product, sales in top_products.items():
             print(f"  {product}: {sales:.0f}")
         
         # Анализ по складам
         if 'warehouse' in ozon_stocks.columns:
             print(f"\nРаспределение остатков по складам:")
-            warehouse_stocks = ozon_stocks.groupby('warehouse')['stock'].sum().sort_values(ascending=False)
+            warehouse_stocks = ozon_stocks.groupby('warehouse', observed=True)['stock'].sum().sort_values(ascending=False)
             for warehouse, stock in warehouse_stocks.items():
                 print(f"  {warehouse}: {stock:.0f}")
     
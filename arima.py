@@ -3,7 +3,8 @@ ARIMA/SARIMA/SARIMAX модели прогнозирования
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, Optional, Tuple
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -15,9 +16,98 @@ except ImportError:
     STATSMODELS_AVAILABLE = False
     print("Warning: statsmodels не установлен. ARIMA модели недоступны.")
 
+try:
+    from joblib import Parallel, delayed, parallel_config
+    JOBLIB_AVAILABLE = True
+except ImportError:
+    JOBLIB_AVAILABLE = False
+
+
+# Компактное состояние обученной модели: параметры и обучающий ряд.
+# Полный объект результатов statsmodels восстанавливается по требованию
+ARIMAState = namedtuple('ARIMAState', ['params', 'endog'])
+
+
+def _build_model(ts: np.ndarray, order: Tuple[int, int, int],
+                 seasonal_order: Tuple[int, int, int, int] = None):
+    """Создает (необученную) модель statsmodels"""
+    if seasonal_order is not None:
+        return SARIMAX(ts, order=order, seasonal_order=seasonal_order)
+    return ARIMA(ts, order=order)
+
+
+def _fit_model(ts: np.ndarray, order: Tuple[int, int, int],
+               seasonal_order: Tuple[int, int, int, int] = None,
+               start_params: np.ndarray = None):
+    """Создает и обучает модель statsmodels"""
+    model = _build_model(ts, order, seasonal_order)
+    if seasonal_order is not None:
+        return model.fit(disp=False, start_params=start_params)
+    
+    # Для несезонной модели используем быстрый метод innovations_mle.
+    # start_params для него передаются через method_kwargs
+    method_kwargs = {'start_params': start_params} if start_params is not None else None
+    try:
+        fitted_model = model.fit(method='innovations_mle', method_kwargs=method_kwargs)
+        if np.all(np.isfinite(fitted_model.params)):
+            return fitted_model
+    except Exception:
+        pass
+    
+    # На постоянных и коротких рядах innovations_mle падает или дает
+    # неконечные параметры - обучаем методом statespace по умолчанию
+    return model.fit(start_params=start_params)
+
+
+def _fit_one(ts: np.ndarray, order: Tuple[int, int, int],
+             seasonal_order: Tuple[int, int, int, int] = None,
+             start_params: np.ndarray = None):
+    """
+    Обучает ARIMA/SARIMA модель на одном временном ряду
+    
+    Warm start не решает, обучится ли модель: для коротких рядов (меньше
+    двух наблюдений на параметр) он не используется, а при ошибке или
+    неконечных параметрах модель обучается заново без начальных параметров.
+    
+    Args:
+        ts: Временной ряд
+        order: (p, d, q) параметры ARIMA
+        seasonal_order: (P, D, Q, s) параметры сезонности для SARIMA
+        start_params: Начальные параметры оптимизации (warm start)
+    
+    Returns:
+        Кортеж (ARIMAState или None, текст ошибки или None)
+    """
+    if start_params is not None and len(ts) < 2 * len(start_params):
+        start_params = None
+    
+    if start_params is not None:
+        state, error = _fit_state(ts, order, seasonal_order, start_params)
+        if error is None and np.all(np.isfinite(state.params)):
+            return state, None
+    
+    return _fit_state(ts, order, seasonal_order, None)
+
+
+def _fit_state(ts: np.ndarray, order: Tuple[int, int, int],
+               seasonal_order: Tuple[int, int, int, int] = None,
+               start_params: np.ndarray = None):
+    """Одна попытка обучения: (ARIMAState или None, текст ошибки или None)"""
+    try:
+        fitted_model = _fit_model(ts, order, seasonal_order, start_params)
+        return ARIMAState(np.asarray(fitted_model.params, dtype=np.float64), ts), None
+    except Exception as e:
+        return None, str(e)
+
 
 class ARIMAModel:
-    """ARIMA модель прогнозирования"""
+    """
+    ARIMA модель прогнозирования
+    
+    В self.models хранятся не объекты результатов statsmodels, а компактные
+    ARIMAState (параметры и обучающий ряд), поэтому модель для тысяч
+    продуктов занимает мало памяти и быстро сериализуется.
+    """
     
     def __init__(self, order: Tuple[int, int, int] = (1, 1, 1), 
                  seasonal_order: Tuple[int, int, int, int] = None):
@@ -35,6 +125,13 @@ class ARIMAModel:
         self.seasonal_order = seasonal_order
         self.models = {}
         self.is_sarima = seasonal_order is not None
+        # Минимальное число наблюдений для обучения
+        self.min_obs = max(order) + 1
+        # Последнее обученное состояние каждого продукта {unified_code: ARIMAState}.
+        # Его параметры - warm start только для обучения на начальном отрезке
+        # того же ряда (кросс-валидация после полного обучения), поэтому
+        # результат не зависит от порядка и истории обработки продуктов
+        self._start_states = {}
     
     def fit(self, data: pd.DataFrame, unified_code: str):
         """
@@ -44,28 +141,107 @@ class ARIMAModel:
             data: DataFrame с колонками 'date' и 'quantity'
             unified_code: Унифицированный код продукта
         """
-        if data.empty or 'quantity' not in data.columns:
+        ts = self._prepare_series(data)
+        if ts is None:
             self.models[unified_code] = None
             return
         
-        if len(data) < max(self.order) + 1:
-            self.models[unified_code] = None
+        state, error = _fit_one(ts, self.order, self.seasonal_order,
+                                self._start_params(unified_code, ts))
+        if error is not None:
+            print(f"Ошибка обучения ARIMA для {unified_code}: {error}")
+        self.models[unified_code] = state
+        self._update_start_params(unified_code, state)
+    
+    def fit_many(self, data_by_code: Dict[str, pd.DataFrame], n_jobs: int = -1):
+        """
+        Параллельное обучение моделей для нескольких продуктов
+        
+        Args:
+            data_by_code: Словарь {unified_code: DataFrame с колонками 'date' и 'quantity'}
+            n_jobs: Количество процессов (-1 - все ядра)
+        """
+        if not JOBLIB_AVAILABLE:
+            for unified_code, data in data_by_code.items():
+                self.fit(data, unified_code)
             return
         
-        try:
-            ts = data['quantity'].fillna(0).values
-            
-            if self.is_sarima:
-                model = SARIMAX(ts, order=self.order, seasonal_order=self.seasonal_order)
+        series = {}
+        for unified_code, data in data_by_code.items():
+            ts = self._prepare_series(data)
+            if ts is None:
+                self.models[unified_code] = None
             else:
-                model = ARIMA(ts, order=self.order)
-            
-            fitted_model = model.fit(disp=False)
-            self.models[unified_code] = fitted_model
-            
-        except Exception as e:
-            print(f"Ошибка обучения ARIMA для {unified_code}: {e}")
-            self.models[unified_code] = None
+                series[unified_code] = ts
+        
+        # BLAS в процессах-исполнителях ограничивается одним потоком,
+        # чтобы процессы не конкурировали за ядра
+        with parallel_config(backend='loky', inner_max_num_threads=1):
+            results = Parallel(n_jobs=n_jobs)(
+                delayed(_fit_one)(ts, self.order, self.seasonal_order,
+                                  self._start_params(unified_code, ts))
+                for unified_code, ts in series.items()
+            )
+        
+        for unified_code, (state, error) in zip(series.keys(), results):
+            if error is not None:
+                print(f"Ошибка обучения ARIMA для {unified_code}: {error}")
+            self.models[unified_code] = state
+            self._update_start_params(unified_code, state)
+    
+    def _start_params(self, unified_code: str, ts: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Начальные параметры для обучения продукта на ряде ts
+        
+        Warm start берется из прошлого обучения того же продукта, только
+        если ts - строгое начало ряда, на котором оно выполнялось.
+        """
+        state = self._start_states.get(unified_code)
+        if state is None or len(ts) >= len(state.endog):
+            return None
+        if not np.array_equal(state.endog[:len(ts)], ts):
+            return None
+        return state.params
+    
+    def _update_start_params(self, unified_code: str, state: Optional[ARIMAState]):
+        """Запоминает обученное состояние продукта для warm start"""
+        if state is None:
+            self._start_states.pop(unified_code, None)
+            return
+        
+        if np.all(np.isfinite(state.params)):
+            self._start_states[unified_code] = state
+    
+    def _restore(self, state: ARIMAState):
+        """
+        Восстанавливает результаты statsmodels по сохраненному состоянию
+        
+        Args:
+            state: Параметры и обучающий ряд модели
+        
+        Returns:
+            Результаты фильтрации с методом forecast
+        """
+        model = _build_model(state.endog, self.order, self.seasonal_order)
+        return model.filter(state.params)
+    
+    def _prepare_series(self, data: pd.DataFrame) -> Optional[np.ndarray]:
+        """
+        Подготавливает временной ряд для обучения
+        
+        Args:
+            data: DataFrame с колонками 'date' и 'quantity'
+        
+        Returns:
+            Массив значений или None, если данных недостаточно
+        """
+        if data.empty or 'quantity' not in data.columns:
+            return None
+        
+        if len(data) < self.min_obs:
+            return None
+        
+        return data['quantity'].fillna(0).values
     
     def predict(self, unified_code: str, periods: int = 18) -> np.ndarray:
         """
@@ -82,13 +258,40 @@ class ARIMAModel:
             return np.zeros(periods)
         
         try:
-            forecast = self.models[unified_code].forecast(steps=periods)
+            forecast = self._restore(self.models[unified_code]).forecast(steps=periods)
             forecast = np.maximum(forecast, 0)  # Отрицательные значения не имеют смысла
             return forecast
         except Exception as e:
             print(f"Ошибка прогноза ARIMA для {unified_code}: {e}")
             return np.zeros(periods)
     
+    def predict_many(self, unified_codes: List[str], periods: int = 18) -> np.ndarray:
+        """
+        Прогноз на periods месяцев сразу для нескольких продуктов
+        
+        Args:
+            unified_codes: Список унифицированных кодов продуктов
+            periods: Количество периодов для прогноза
+        
+        Returns:
+            Матрица прогнозов размера (len(unified_codes), periods)
+        """
+        result = np.zeros((len(unified_codes), periods), dtype=np.float64)
+        
+        for i, unified_code in enumerate(unified_codes):
+            state = self.models.get(unified_code)
+            if state is None:
+                continue
+            
+            try:
+                result[i] = self._restore(state).forecast(steps=periods)
+            except Exception as e:
+                print(f"Ошибка прогноза ARIMA для {unified_code}: {e}")
+                result[i] = 0
+        
+        np.maximum(result, 0, out=result)  # Отрицательные значения не имеют смысла
+        return result
+    
     def get_model_name(self) -> str:
         """Возвращает название модели"""
         if self.is_sarima:
@@ -115,6 +318,8 @@ class SARIMAXModel:
         self.seasonal_order = seasonal_order
         self.models = {}
         self.exog_columns = []
+        # Минимальное число наблюдений для обучения
+        self.min_obs = max(order) + max(seasonal_order[:3]) + 1
     
     def fit(self, data: pd.DataFrame, unified_code: str, 
             exog_columns: list = None):
@@ -130,7 +335,7 @@ class SARIMAXModel:
             self.models[unified_code] = None
             return
         
-        if len(data) < max(self.order) + max(self.seasonal_order[:3]) + 1:
+        if len(data) < self.min_obs:
             self.models[unified_code] = None
             return
         
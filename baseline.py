@@ -9,6 +9,9 @@ from typing import Dict, Optional
 class BaselineModel:
     """Простая baseline модель на основе среднего/медианы"""
     
+    # Минимальное число наблюдений для обучения
+    min_obs = 1
+    
     def __init__(self, method: str = 'mean'):
         """
         Инициализация
@@ -42,6 +45,27 @@ class BaselineModel:
         
         self.fitted_values[unified_code] = value if not pd.isna(value) else 0
     
+    def fit_all(self, data: pd.DataFrame):
+        """
+        Обучение модели сразу для всех продуктов одним groupby
+        
+        Args:
+            data: DataFrame с колонками 'unified_code', 'date' и 'quantity'
+                  (отсортированный по дате внутри продукта)
+        """
+        if data.empty or 'quantity' not in data.columns:
+            return
+        
+        grouped = data.groupby('unified_code', sort=False, observed=True)
+        if self.method == 'median':
+            values = grouped['quantity'].median()
+        elif self.method == 'last':
+            values = grouped.tail(1).set_index('unified_code')['quantity']
+        else:
+            values = grouped['quantity'].mean()
+        
+        self.fitted_values.update(values.fillna(0).to_dict())
+    
     def predict(self, unified_code: str, periods: int = 18) -> np.ndarray:
         """
         Прогноз на periods месяцев
@@ -51,13 +75,10 @@ class BaselineModel:
             periods: Количество периодов для прогноза
         
         Returns:
-            Массив прогнозных значений
+            Массив прогнозных значений (только для чтения)
         """
-        if unified_code not in self.fitted_values:
-            return np.zeros(periods)
-        
-        value = self.fitted_values[unified_code]
-        return np.full(periods, value)
+        value = self.fitted_values.get(unified_code, 0.0)
+        return np.broadcast_to(np.float64(value), (periods,))
     
     def get_model_name(self) -> str:
         """Возвращает название модели"""
@@ -3,12 +3,35 @@
 """
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime
 import holidays
 
+# Максимальное количество диапазонов дат в кэше календарных признаков
+FEATURE_CACHE_SIZE = 8
+
 
 class CalendarFeatures:
-    """Класс для создания календарных признаков"""
+    """
+    Класс для создания календарных признаков
+    
+    Бинарные признаки (is_*, month_*, day_of_week_*) хранятся в int8.
+    """
+    
+    # Календарь праздников общий для всех экземпляров
+    _ru_holidays = None
+    
+    @classmethod
+    def _get_ru_holidays(cls) -> holidays.HolidayBase:
+        """
+        Возвращает календарь праздников России, создавая его один раз
+        
+        Returns:
+            Объект holidays.Russia на 2020-2029 годы
+        """
+        if cls._ru_holidays is None:
+            cls._ru_holidays = holidays.Russia(years=range(2020, 2030))
+        return cls._ru_holidays
     
     def __init__(self, country='RU'):
         """
@@ -18,7 +41,12 @@ class CalendarFeatures:
             country: Код страны для праздников (по умолчанию RU - Россия)
         """
         self.country = country
-        self.ru_holidays = holidays.Russia(years=range(2020, 2030))
+        self.ru_holidays = self._get_ru_holidays()
+        self._holiday_ords = frozenset(d.toordinal() for d in self.ru_holidays)
+        self._holiday_np = np.array(
+            sorted({np.datetime64(d, 'D') for d in self.ru_holidays}),
+            dtype='datetime64[D]'
+        )
         
         # Даты черной пятницы для Ozon и Wildberries (примерные, нужно уточнить)
         self.ozon_black_friday_dates = [
@@ -32,11 +60,18 @@ class CalendarFeatures:
             pd.Timestamp('2024-11-29'),
             pd.Timestamp('2025-11-28'),
         ]
+        
+        # LRU-кэш календарных признаков {(marketplace, начало, конец): DataFrame}
+        self._feature_cache = OrderedDict()
     
     def add_calendar_features(self, df: pd.DataFrame, marketplace: str = 'wb') -> pd.DataFrame:
         """
         Добавляет календарные признаки к DataFrame
         
+        Признаки считаются один раз для диапазона дат и кэшируются,
+        поэтому повторные вызовы для разных продуктов с тем же периодом
+        не пересчитывают календарь.
+        
         Args:
             df: DataFrame с колонкой 'date'
             marketplace: 'wb' или 'ozon'
@@ -44,11 +79,45 @@ class CalendarFeatures:
         Returns:
             DataFrame с добавленными признаками
         """
-        df = df.copy()
-        
+        # Исходный DataFrame не изменяется: копия нужна только там,
+        # где признаки записываются в колонки на месте
         if 'date' not in df.columns:
-            return df
+            return df.copy()
+        
+        dates_d = df['date'].values.astype('datetime64[D]')
+        if len(dates_d) == 0 or np.isnat(dates_d).any():
+            return self._build_calendar_features(df.copy(), marketplace)
+        
+        start, end = dates_d.min(), dates_d.max()
+        key = (marketplace, start, end)
+        features = self._feature_cache.get(key)
+        if features is None:
+            calendar = pd.DataFrame({'date': pd.date_range(start, end, freq='D')})
+            features = self._build_calendar_features(calendar, marketplace).drop(columns='date')
+            self._feature_cache[key] = features
+            if len(self._feature_cache) > FEATURE_CACHE_SIZE:
+                self._feature_cache.popitem(last=False)
+        else:
+            self._feature_cache.move_to_end(key)
+        
+        # Каждой строке соответствует день календаря по смещению от начала
+        positions = (dates_d - start).astype(np.int64)
+        calendar_part = features.iloc[positions].set_axis(df.index)
+        df = df.drop(columns=features.columns, errors='ignore')
+        
+        return pd.concat([df, calendar_part], axis=1)
+    
+    def _build_calendar_features(self, df: pd.DataFrame, marketplace: str) -> pd.DataFrame:
+        """
+        Рассчитывает календарные признаки для каждой строки DataFrame
         
+        Args:
+            df: DataFrame с колонкой 'date' (изменяется на месте)
+            marketplace: 'wb' или 'ozon'
+        
+        Returns:
+            DataFrame с добавленными признаками
+        """
         # Базовые признаки
         df['year'] = df['date'].dt.year
         df['month'] = df['date'].dt.month
@@ -59,12 +128,11 @@ class CalendarFeatures:
         df['quarter'] = df['date'].dt.quarter
         
         # Выходные дни (суббота=5, воскресенье=6)
-        df['is_weekend'] = (df['day_of_week'] >= 5).astype(int)
+        df['is_weekend'] = (df['day_of_week'] >= 5).astype(np.int8)
         
         # Праздники
-        df['is_holiday'] = df['date'].apply(
-            lambda x: 1 if x in self.ru_holidays else 0
-        )
+        dates_d = df['date'].values.astype('datetime64[D]')
+        df['is_holiday'] = np.isin(dates_d, self._holiday_np).astype(np.int8)
         
         # Черная пятница
         if marketplace == 'ozon':
@@ -72,36 +140,48 @@ class CalendarFeatures:
         else:
             black_friday_dates = self.wb_black_friday_dates
         
-        df['is_black_friday'] = df['date'].apply(
-            lambda x: 1 if x in black_friday_dates else 0
-        )
+        bf_np = np.array(black_friday_dates, dtype='datetime64[D]')
+        df['is_black_friday'] = np.isin(dates_d, bf_np).astype(np.int8)
         
         # Период вокруг черной пятницы (неделя до и после)
-        df['is_black_friday_period'] = 0
-        for bf_date in black_friday_dates:
-            period_start = bf_date - timedelta(days=7)
-            period_end = bf_date + timedelta(days=7)
-            mask = (df['date'] >= period_start) & (df['date'] <= period_end)
-            df.loc[mask, 'is_black_friday_period'] = 1
+        if len(bf_np) > 0:
+            diff_days = np.abs((dates_d[:, None] - bf_np[None, :]).astype(np.int64))
+            in_period = (diff_days.min(axis=1) <= 7) & ~np.isnat(dates_d)
+            df['is_black_friday_period'] = in_period.astype(np.int8)
+        else:
+            df['is_black_friday_period'] = np.int8(0)
         
         # Новогодние праздники (декабрь-январь)
         df['is_new_year_period'] = (
             ((df['month'] == 12) & (df['day'] >= 20)) |
             ((df['month'] == 1) & (df['day'] <= 10))
-        ).astype(int)
+        ).astype(np.int8)
         
         # Летний период (июнь-август)
-        df['is_summer'] = df['month'].isin([6, 7, 8]).astype(int)
-        
-        # Бинарные признаки для месяцев
-        for month in range(1, 13):
-            df[f'month_{month}'] = (df['month'] == month).astype(int)
+        df['is_summer'] = df['month'].isin([6, 7, 8]).astype(np.int8)
+        
+        # Бинарные признаки для месяцев и дней недели одним блоком
+        month_cols = [f'month_{month}' for month in range(1, 13)]
+        day_cols = [f'day_of_week_{day}' for day in range(7)]
+        one_hot = np.hstack([
+            np.eye(12, dtype=np.int8)[df['month'].to_numpy() - 1],
+            np.eye(7, dtype=np.int8)[df['day_of_week'].to_numpy()],
+        ])
+        one_hot_df = pd.DataFrame(one_hot, columns=month_cols + day_cols, index=df.index)
+        
+        return pd.concat([df, one_hot_df], axis=1)
+    
+    def is_holiday(self, ts) -> int:
+        """
+        Проверяет, является ли дата праздником
         
-        # Бинарные признаки для дней недели
-        for day in range(7):
-            df[f'day_of_week_{day}'] = (df['day_of_week'] == day).astype(int)
+        Args:
+            ts: Дата (datetime, date или pd.Timestamp)
         
-        return df
+        Returns:
+            1 если дата праздничная, иначе 0
+        """
+        return int(ts.toordinal() in self._holiday_ords)
     
     def get_future_calendar_features(self, start_date: pd.Timestamp, 
                                      periods: int = 18, 
@@ -136,5 +216,6 @@ class CalendarFeatures:
         """
         self.ozon_black_friday_dates = [pd.Timestamp(d) for d in ozon_dates]
         self.wb_black_friday_dates = [pd.Timestamp(d) for d in wb_dates]
+        self._feature_cache.clear()
 
 
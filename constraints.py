@@ -3,10 +3,57 @@
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, Optional
+from typing import Dict, Optional, Union
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _round_boxes(shipment, sizes, out_shipment, out_boxes):
+        """Округляет отгрузки вверх до целого числа коробов"""
+        for i in prange(shipment.shape[0]):
+            boxes = np.ceil(shipment[i] / sizes[i])
+            out_boxes[i] = boxes
+            out_shipment[i] = boxes * sizes[i]
+    
+    @njit(parallel=True, cache=True)
+    def _round_boxes_by_code(codes, shipment, box_np, out_shipment, out_boxes):
+        """Округляет отгрузки до коробов, размер короба берется по коду категории"""
+        for i in prange(shipment.shape[0]):
+            size = box_np[codes[i]]
+            boxes = np.ceil(shipment[i] / size)
+            out_boxes[i] = boxes
+            out_shipment[i] = boxes * size
+
+
+def _isin_codes(values: pd.Series, codes) -> np.ndarray:
+    """
+    Булева маска принадлежности значений множеству кодов
+    
+    Для категориальной колонки проверяются только категории,
+    а маска строк получается индексированием по кодам категорий.
+    
+    Args:
+        values: Колонка с кодами продуктов
+        codes: Набор кодов для проверки
+    
+    Returns:
+        Булев массив длины len(values)
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        category_mask = values.cat.categories.isin(list(codes))
+        # Код -1 (пропуск) попадает на добавленный в конец False
+        return np.append(category_mask, False)[values.cat.codes.to_numpy()]
+    
+    return values.isin(codes).to_numpy()
+
 
 class Constraints:
     """Класс для применения ограничений"""
@@ -23,104 +70,98 @@ class Constraints:
     
     def apply_withdraw_constraints(self, forecast: pd.DataFrame,
                                   withdraw_list: pd.DataFrame,
-                                  wb_stocks: pd.DataFrame,
-                                  ozon_stocks: pd.DataFrame,
-                                  our_stocks: pd.DataFrame) -> pd.DataFrame:
+                                  wb_stocks: Union[pd.DataFrame, Dict[str, float]],
+                                  ozon_stocks: Union[pd.DataFrame, Dict[str, float]],
+                                  our_stocks: Union[pd.DataFrame, Dict[str, float]]) -> pd.DataFrame:
         """
         Применяет ограничения для продуктов на вывод
         
         Args:
             forecast: DataFrame с прогнозом
             withdraw_list: Список продуктов на вывод
-            wb_stocks: Остатки на Wildberries
-            ozon_stocks: Остатки на Ozon
-            our_stocks: Остатки на нашем складе
+            wb_stocks: Остатки на Wildberries (DataFrame или результат get_latest_stocks)
+            ozon_stocks: Остатки на Ozon (DataFrame или результат get_latest_stocks)
+            our_stocks: Остатки на нашем складе (DataFrame или результат get_latest_stocks)
         
         Returns:
             DataFrame с примененными ограничениями
         """
-        forecast = forecast.copy()
-        
         if withdraw_list.empty:
             return forecast
         
         # Получаем список продуктов на вывод
-        withdraw_codes = set(withdraw_list['unified_code'].unique())
+        withdraw_codes = pd.Series(withdraw_list['unified_code'].unique())
         
         # Получаем последние остатки
-        latest_wb_stocks = self._get_latest_stocks(wb_stocks)
-        latest_ozon_stocks = self._get_latest_stocks(ozon_stocks)
-        latest_our_stocks = self._get_latest_stocks(our_stocks)
-        
-        # Применяем ограничения
-        for unified_code in withdraw_codes:
-            if unified_code not in forecast['unified_code'].values:
-                continue
-            
-            # Суммируем остатки
-            wb_total = latest_wb_stocks.get(unified_code, 0)
-            ozon_total = latest_ozon_stocks.get(unified_code, 0)
-            our_total = latest_our_stocks.get(unified_code, 0)
-            
-            total_stock = wb_total + ozon_total + our_total
-            
-            # Если остатков нет, обнуляем прогноз
-            if total_stock <= 0:
-                forecast.loc[forecast['unified_code'] == unified_code, 'quantity'] = 0
-        
-        return forecast
+        latest_wb_stocks = self.get_latest_stocks(wb_stocks)
+        latest_ozon_stocks = self.get_latest_stocks(ozon_stocks)
+        latest_our_stocks = self.get_latest_stocks(our_stocks)
+        
+        # Суммируем остатки по всем складам
+        total_stock = (
+            pd.Series(latest_wb_stocks, dtype=float)
+            .add(pd.Series(latest_ozon_stocks, dtype=float), fill_value=0)
+            .add(pd.Series(latest_our_stocks, dtype=float), fill_value=0)
+        )
+        
+        # Если остатков нет, обнуляем прогноз
+        zero_codes = withdraw_codes[withdraw_codes.map(total_stock).fillna(0) <= 0]
+        quantity = forecast['quantity'].to_numpy(copy=True)
+        quantity[_isin_codes(forecast['unified_code'], zero_codes)] = 0
+        
+        return forecast.assign(quantity=quantity)
     
     def apply_defecture_constraints(self, forecast: pd.DataFrame,
                                    defecture_list: pd.DataFrame,
-                                   wb_stocks: pd.DataFrame,
-                                   ozon_stocks: pd.DataFrame) -> pd.DataFrame:
+                                   wb_stocks: Union[pd.DataFrame, Dict[str, float]],
+                                   ozon_stocks: Union[pd.DataFrame, Dict[str, float]]) -> pd.DataFrame:
         """
         Применяет ограничения для продуктов в дефектуре
         
         Args:
             forecast: DataFrame с прогнозом
             defecture_list: Список продуктов в дефектуре
-            wb_stocks: Остатки на Wildberries
-            ozon_stocks: Остатки на Ozon
+            wb_stocks: Остатки на Wildberries (DataFrame или результат get_latest_stocks)
+            ozon_stocks: Остатки на Ozon (DataFrame или результат get_latest_stocks)
         
         Returns:
             DataFrame с примененными ограничениями
         """
-        forecast = forecast.copy()
-        
         if defecture_list.empty:
             return forecast
         
         # Получаем последние остатки на маркетплейсах
-        latest_wb_stocks = self._get_latest_stocks(wb_stocks)
-        latest_ozon_stocks = self._get_latest_stocks(ozon_stocks)
+        latest_wb_stocks = self.get_latest_stocks(wb_stocks)
+        latest_ozon_stocks = self.get_latest_stocks(ozon_stocks)
+        
+        # Последняя дата прогноза по каждому продукту
+        last_dates = forecast.groupby('unified_code', sort=False)['date'].max()
+        
+        # Дата окончания неизвестна - считаем дефектуру бессрочной.
+        # Коды переводятся из категорий в объекты: map по категориальной
+        # колонке может вернуть категории, а их нельзя сравнивать с датами
+        codes = defecture_list['unified_code'].astype(object)
+        if 'end_date' in defecture_list.columns:
+            end_dates = defecture_list['end_date'].fillna(pd.Timestamp.max)
+        else:
+            end_dates = pd.Series(pd.Timestamp.max, index=defecture_list.index)
         
-        # Применяем ограничения
-        for _, defecture_row in defecture_list.iterrows():
-            unified_code = defecture_row['unified_code']
-            end_date = defecture_row.get('end_date', pd.Timestamp.max)
-            
-            if unified_code not in forecast['unified_code'].values:
-                continue
-            
-            # Проверяем дату окончания дефектуры
-            future_dates = forecast[
-                (forecast['unified_code'] == unified_code) & 
-                (forecast['date'] > end_date)
-            ]
-            
-            if len(future_dates) == 0:
-                # Если дефектура еще не закончилась, проверяем остатки
-                wb_total = latest_wb_stocks.get(unified_code, 0)
-                ozon_total = latest_ozon_stocks.get(unified_code, 0)
-                
-                total_stock = wb_total + ozon_total
-                
-                # Если остатков нет, обнуляем прогноз
-                if total_stock <= 0:
-                    forecast.loc[forecast['unified_code'] == unified_code, 'quantity'] = 0
-        
-        return forecast
+        # Дефектура не заканчивается в горизонте прогноза,
+        # если ни одна дата прогноза не позже даты ее окончания
+        product_last_dates = codes.map(last_dates)
+        in_forecast = product_last_dates.notna()
+        not_finished = product_last_dates <= end_dates
+        
+        # Суммируем остатки на маркетплейсах
+        total_stock = (codes.map(latest_wb_stocks).fillna(0) +
+                       codes.map(latest_ozon_stocks).fillna(0))
+        
+        # Если остатков нет, обнуляем прогноз
+        zero_codes = codes[in_forecast & not_finished & (total_stock <= 0)]
+        quantity = forecast['quantity'].to_numpy(copy=True)
+        quantity[_isin_codes(forecast['unified_code'], zero_codes)] = 0
+        
+        return forecast.assign(quantity=quantity)
     
     def apply_box_constraints(self, shipments: pd.DataFrame,
                              box_sizes: Dict[str, int] = None) -> pd.DataFrame:
@@ -134,35 +175,52 @@ class Constraints:
         Returns:
             DataFrame с округленными отгрузками
         """
-        shipments = shipments.copy()
-        
         if shipments.empty:
             return shipments
         
         if box_sizes is None:
             box_sizes = self.box_sizes
         
-        # Округляем отгрузки
-        for idx, row in shipments.iterrows():
-            unified_code = row['unified_code']
-            shipment = row['shipment']
-            
-            # Определяем размер короба
-            if box_sizes and unified_code in box_sizes:
-                box_size = box_sizes[unified_code]
-            elif isinstance(box_sizes, dict) and 'default' in box_sizes:
-                box_size = box_sizes['default']
-            else:
-                box_size = self.default_box_size
-            
-            # Округляем вверх до ближайшего короба
-            boxes = np.ceil(shipment / box_size)
-            rounded_shipment = boxes * box_size
+        # Определяем размер короба для каждой строки
+        default_size = box_sizes.get('default', self.default_box_size) if box_sizes else self.default_box_size
+        shipment = shipments['shipment'].to_numpy(dtype=np.float64)
+        unified_code = shipments['unified_code']
+        if (NUMBA_AVAILABLE and box_sizes and
+                isinstance(unified_code.dtype, pd.CategoricalDtype)):
+            # Размер короба считается один раз на категорию, а строки
+            # обращаются к нему по коду категории (-1 - последний элемент)
+            categories = unified_code.cat.categories
+            box_np = np.fromiter(
+                (box_sizes.get(code, default_size) for code in categories),
+                dtype=np.float64, count=len(categories)
+            )
+            box_np = np.append(box_np, default_size)
+            box_np = np.where(box_np > 0, box_np, self.default_box_size)
             
-            shipments.loc[idx, 'shipment'] = rounded_shipment
-            shipments.loc[idx, 'boxes'] = boxes
+            codes = unified_code.cat.codes.to_numpy().astype(np.int64)
+            codes[codes < 0] = len(categories)
+            rounded = np.empty_like(shipment)
+            boxes = np.empty_like(shipment)
+            _round_boxes_by_code(codes, shipment, box_np, rounded, boxes)
+            return shipments.assign(shipment=rounded, boxes=boxes)
+        
+        if box_sizes:
+            sizes = shipments['unified_code'].map(box_sizes).fillna(default_size)
+            sizes = sizes.to_numpy(dtype=np.float64)
+        else:
+            sizes = np.full(len(shipments), default_size, dtype=np.float64)
+        sizes = np.where(sizes > 0, sizes, self.default_box_size)
+        
+        # Округляем вверх до ближайшего короба
+        if NUMBA_AVAILABLE:
+            rounded = np.empty_like(shipment)
+            boxes = np.empty_like(shipment)
+            _round_boxes(shipment, sizes, rounded, boxes)
+        else:
+            boxes = np.ceil(shipment / sizes)
+            rounded = boxes * sizes
         
-        return shipments
+        return shipments.assign(shipment=rounded, boxes=boxes)
     
     def apply_shipment_withdraw_constraints(self, shipments: pd.DataFrame,
                                           withdraw_list: pd.DataFrame) -> pd.DataFrame:
@@ -176,15 +234,14 @@ class Constraints:
         Returns:
             DataFrame с примененными ограничениями
         """
-        shipments = shipments.copy()
-        
         if withdraw_list.empty:
             return shipments
         
         withdraw_codes = set(withdraw_list['unified_code'].unique())
-        shipments.loc[shipments['unified_code'].isin(withdraw_codes), 'shipment'] = 0
+        shipment = shipments['shipment'].to_numpy(copy=True)
+        shipment[_isin_codes(shipments['unified_code'], withdraw_codes)] = 0
         
-        return shipments
+        return shipments.assign(shipment=shipment)
     
     def apply_shipment_defecture_constraints(self, shipments: pd.DataFrame,
                                            defecture_list: pd.DataFrame) -> pd.DataFrame:
@@ -198,40 +255,44 @@ class Constraints:
         Returns:
             DataFrame с примененными ограничениями
         """
-        shipments = shipments.copy()
-        
         if defecture_list.empty:
             return shipments
         
         defecture_codes = set(defecture_list['unified_code'].unique())
-        shipments.loc[shipments['unified_code'].isin(defecture_codes), 'shipment'] = 0
+        shipment = shipments['shipment'].to_numpy(copy=True)
+        shipment[_isin_codes(shipments['unified_code'], defecture_codes)] = 0
         
-        return shipments
+        return shipments.assign(shipment=shipment)
     
-    def _get_latest_stocks(self, stocks: pd.DataFrame) -> Dict[str, float]:
+    def get_latest_stocks(self, stocks: Union[pd.DataFrame, Dict[str, float]]) -> Dict[str, float]:
         """
         Получает последние остатки по продуктам
         
+        Уже посчитанный словарь возвращается как есть, поэтому вызывающий
+        код может посчитать остатки один раз и передать их в несколько ограничений.
+        
         Args:
-            stocks: DataFrame с остатками
+            stocks: DataFrame с остатками или словарь {unified_code: stock}
         
         Returns:
             Словарь {unified_code: stock}
         """
+        if isinstance(stocks, dict):
+            return stocks
+        
         if stocks.empty:
             return {}
         
+        if 'unified_code' not in stocks.columns or 'stock' not in stocks.columns:
+            return {}
+        
         if 'date' in stocks.columns:
             latest_date = stocks['date'].max()
-            latest_stocks = stocks[stocks['date'] == latest_date]
+            latest_stocks = stocks.loc[stocks['date'] == latest_date, ['unified_code', 'stock']]
         else:
             latest_stocks = stocks
         
-        if 'unified_code' in latest_stocks.columns and 'stock' in latest_stocks.columns:
-            result = latest_stocks.groupby('unified_code')['stock'].sum().to_dict()
-            return result
-        
-        return {}
+        return latest_stocks.groupby('unified_code', sort=False, observed=True)['stock'].sum().to_dict()
     
     def set_box_sizes(self, box_sizes: Dict[str, int]):
         """
@@ -4,23 +4,231 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import warnings
-warnings.filterwarnings('ignore')
+
+try:
+    import pyarrow
+    import pyarrow.csv as pa_csv
+    import pyarrow.feather as feather
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    import python_calamine
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+# Версия загруженных данных в Feather-кэше. Увеличивается при изменении
+# типов колонок или обработки, чтобы не читать кэш старого формата
+CACHE_VERSION = 2
+
+# Колонки года и месяца, из которых собирается дата, если нет колонки 'Дата'
+DATE_PART_COLUMNS = ['Годы (Дата)', 'Месяцы (Дата)']
+
+# Типы колонок исходных CSV по видам источников. Парсер pyarrow
+# не выводит для них типы, а при несовпадении данных со схемой
+# файл читается заново с выводом типов. Даты не типизируются:
+# их формат в выгрузках может отличаться от ISO. Коды продуктов
+# тоже не типизируются: их тип выводится, как при чтении XLSX,
+# иначе коды из CSV и XLSX источников не совпадут
+if PYARROW_AVAILABLE:
+    SCHEMAS = {
+        'sales': pyarrow.schema([
+            ('Количество упак.', pyarrow.int32()),
+        ]),
+        'stocks': pyarrow.schema([
+            ('Остаток', pyarrow.int32()),
+            ('Склад', pyarrow.string()),
+        ]),
+        'shipments': pyarrow.schema([
+            ('Кол-во упаково', pyarrow.int32()),
+        ]),
+    }
+else:
+    SCHEMAS = {}
+
+try:
+    import polars as pl
+    POLARS_AVAILABLE = True
+except ImportError:
+    POLARS_AVAILABLE = False
+
+
+def _polars_agg_exprs(aggs: Dict[str, str]) -> list:
+    """
+    Переводит словарь агрегаций в стиле pandas в выражения Polars
+    
+    'first' пропускает пустые значения, как GroupBy.first в pandas.
+    
+    Args:
+        aggs: Словарь {колонка: 'sum', 'mean' или 'first'}
+    
+    Returns:
+        Список выражений polars
+    """
+    exprs = []
+    for col, how in aggs.items():
+        if how == 'sum':
+            exprs.append(pl.col(col).sum())
+        elif how == 'mean':
+            exprs.append(pl.col(col).mean())
+        elif how == 'first':
+            exprs.append(pl.col(col).drop_nulls().first())
+        else:
+            raise ValueError(f"Неподдерживаемая агрегация: {how}")
+    return exprs
+
+
+def _pl_groupby_agg(df: pd.DataFrame, keys: List[str], aggs: Dict[str, str],
+                    use_polars: bool = True) -> pd.DataFrame:
+    """
+    Аналог df.groupby(keys).agg(aggs).reset_index() с агрегацией в Polars
+    
+    Результат, как в pandas, отсортирован по ключам, строки с пустыми
+    ключами отбрасываются. Без polars (или при ошибке конвертации)
+    используется pandas.
+    
+    Args:
+        df: Исходный DataFrame
+        keys: Колонки группировки
+        aggs: Словарь {колонка: 'sum', 'mean' или 'first'}
+        use_polars: Разрешить использование Polars
+    
+    Returns:
+        Сгруппированный DataFrame
+    """
+    if use_polars and POLARS_AVAILABLE and not df.empty:
+        try:
+            return (
+                pl.from_pandas(df[keys + list(aggs)])
+                .lazy()
+                .drop_nulls(keys)
+                .group_by(keys)
+                .agg(_polars_agg_exprs(aggs))
+                .sort(keys)
+                .collect()
+                .to_pandas()
+            )
+        except Exception:
+            pass
+    
+    return df.groupby(keys).agg(aggs).reset_index()
+
+
+def _require_columns(columns, required, file_path: Path):
+    """
+    Проверяет, что в загруженных данных есть все нужные колонки
+    
+    Args:
+        columns: Колонки загруженных данных
+        required: Колонки, без которых источник нельзя обработать
+        file_path: Путь к файлу (для сообщения об ошибке)
+    
+    Raises:
+        ValueError: Если каких-то колонок нет
+    """
+    missing = [col for col in required if col not in columns]
+    if missing:
+        raise ValueError(f"В файле {file_path.name} нет колонок: {', '.join(missing)}")
+
+
+def _compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Уменьшает объем загруженных данных
+    
+    Целочисленные количества и остатки переводятся в int32 (если значения
+    помещаются), а повторяющиеся строковые коды - в категории.
+    
+    Args:
+        df: DataFrame после переименования колонок
+    
+    Returns:
+        Тот же DataFrame с компактными типами колонок
+    """
+    int32_info = np.iinfo(np.int32)
+    for col in ('quantity', 'stock'):
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]) and len(df) > 0:
+            if df[col].min() >= int32_info.min and df[col].max() <= int32_info.max:
+                df[col] = df[col].astype(np.int32)
+    
+    for col in ('unified_code', 'sku', 'solo_code', 'warehouse'):
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    
+    return df
+
+
+def _fast_to_datetime(s: pd.Series) -> pd.Series:
+    """
+    Преобразует колонку в даты, разбирая каждое уникальное значение один раз
+    
+    В выгрузках одна и та же дата повторяется для всех SKU, поэтому при
+    большом числе повторов разбираются только уникальные значения,
+    а результат раскладывается по строкам через map.
+    
+    Args:
+        s: Колонка с датами (строки или даты)
+    
+    Returns:
+        Колонка datetime64, нераспознанные значения - NaT
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    
+    # Формат дат в выгрузках не задан явно: предупреждение pandas
+    # о поэлементном разборе скрываем только здесь
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=UserWarning)
+        uniques = s.dropna().unique()
+        if len(uniques) == 0 or len(s) <= 4 * len(uniques):
+            return pd.to_datetime(s, errors='coerce')
+        
+        parsed = pd.Series(pd.to_datetime(uniques, errors='coerce'), index=uniques)
+    return s.map(parsed)
+
+
+def _year_month_to_datetime(years: pd.Series, months: pd.Series) -> pd.Series:
+    """
+    Собирает дату первого числа месяца из колонок года и месяца
+    
+    Args:
+        years: Колонка с годами
+        months: Колонка с номерами месяцев
+    
+    Returns:
+        Колонка datetime64, некорректные значения - NaT
+    """
+    # Число вида YYYYMM01 разбирается по фиксированному формату без угадывания
+    yyyymmdd = (pd.to_numeric(years, errors='coerce') * 10000 +
+                pd.to_numeric(months, errors='coerce') * 100 + 1)
+    return pd.to_datetime(yyyymmdd.astype('Int64').astype('string'),
+                          format='%Y%m%d', errors='coerce')
 
 
 class DataLoader:
     """Класс для загрузки и предобработки данных"""
     
-    def __init__(self, data_path: str = "data"):
+    def __init__(self, data_path: str = "data", use_cache: bool = True,
+                 engine: str = "pandas"):
         """
         Инициализация загрузчика данных
         
         Args:
             data_path: Путь к папке с данными
+            use_cache: Кэшировать обработанные данные в Parquet (нужен pyarrow)
+            engine: 'pandas' или 'polars' - движок чтения и агрегации CSV.
+                    Без установленного polars используется pandas
         """
         self.data_path = Path(data_path)
+        self.use_cache = use_cache and PYARROW_AVAILABLE
+        self.engine = engine if POLARS_AVAILABLE else 'pandas'
+        self.cache_path = self.data_path / '.cache'
         self.wb_sales = None
         self.ozon_sales = None
         self.wb_stocks = None
@@ -37,77 +245,310 @@ class DataLoader:
         Returns:
             Словарь с загруженными данными
         """
-        data = {}
+        # Источник -> метод загрузки. Файлы независимы, а чтение и разбор
+        # в pandas/pyarrow большую часть времени не держат GIL,
+        # поэтому загружаем их параллельно в потоках
+        loaders = [
+            ('wb_sales', self._load_sales),
+            ('ozon_sales', self._load_sales),
+            ('wb_stocks', self._load_stocks),
+            ('ozon_stocks', self._load_stocks),
+            ('our_stocks', self._load_our_stocks),
+            ('withdraw', self._load_withdraw),
+            ('defecture', self._load_defecture),
+        ]
         
-        # Загрузка продаж
-        try:
-            self.wb_sales = self._load_sales("wb_sales")
-            data['wb_sales'] = self.wb_sales
-        except Exception as e:
-            print(f"Ошибка загрузки wb_sales: {e}")
+        data = {}
+        with ThreadPoolExecutor(max_workers=len(loaders)) as executor:
+            futures = [
+                (name, executor.submit(self._load_cached, name, loader))
+                for name, loader in loaders
+            ]
             
-        try:
-            self.ozon_sales = self._load_sales("ozon_sales")
-            data['ozon_sales'] = self.ozon_sales
-        except Exception as e:
-            print(f"Ошибка загрузки ozon_sales: {e}")
+            for name, future in futures:
+                try:
+                    df = future.result()
+                    setattr(self, name, df)
+                    data[name] = df
+                except Exception as e:
+                    print(f"Ошибка загрузки {name}: {e}")
         
-        # Загрузка остатков
-        try:
-            self.wb_stocks = self._load_stocks("wb_stocks")
-            data['wb_stocks'] = self.wb_stocks
-        except Exception as e:
-            print(f"Ошибка загрузки wb_stocks: {e}")
-            
-        try:
-            self.ozon_stocks = self._load_stocks("ozon_stocks")
-            data['ozon_stocks'] = self.ozon_stocks
-        except Exception as e:
-            print(f"Ошибка загрузки ozon_stocks: {e}")
+        return data
+    
+    def _resolve_file(self, filename: str) -> Optional[Path]:
+        """Возвращает путь к файлу данных (CSV или XLSX) или None"""
+        for suffix in ('.csv', '.xlsx'):
+            file_path = self.data_path / f"{filename}{suffix}"
+            if file_path.exists():
+                return file_path
+        return None
+    
+    @staticmethod
+    def _fingerprint(file_path: Path) -> str:
+        """Отпечаток файла по пути, времени изменения и размеру"""
+        stat = file_path.stat()
+        key = f"{file_path.resolve()}|{stat.st_mtime_ns}|{stat.st_size}"
+        return hashlib.md5(key.encode('utf-8')).hexdigest()[:16]
+    
+    def _load_cached(self, filename: str, loader) -> pd.DataFrame:
+        """
+        Загружает данные через Feather-кэш
         
-        # Загрузка остатков на нашем складе
-        try:
-            self.our_stocks = self._load_our_stocks("our_stocks")
-            data['our_stocks'] = self.our_stocks
-        except Exception as e:
-            print(f"Ошибка загрузки our_stocks: {e}")
+        Кэш хранится в папке .cache рядом с данными, имя файла кэша содержит
+        отпечаток исходного файла (путь, mtime, размер), движок загрузки
+        и версию формата (CACHE_VERSION). Любое изменение исходника, в том
+        числе замена на старую версию, другой движок или новая версия
+        загрузчика дают промах кэша.
+        
+        Args:
+            filename: Имя файла (без расширения)
+            loader: Метод загрузки исходного файла
+        
+        Returns:
+            DataFrame с данными
+        """
+        source = self._resolve_file(filename)
+        if not self.use_cache or source is None:
+            return loader(filename)
+        
+        fingerprint = self._fingerprint(source)
+        cache_file = self.cache_path / f"{filename}-{fingerprint}-{self.engine}-v{CACHE_VERSION}.feather"
+        if cache_file.exists():
+            return feather.read_feather(cache_file)
+        
+        df = loader(filename)
         
-        # Загрузка списка на вывод
         try:
-            self.withdraw = self._load_withdraw("withdraw")
-            data['withdraw'] = self.withdraw
+            self.cache_path.mkdir(exist_ok=True)
+            # Удаляем кэш предыдущих версий файла и старого формата
+            # (кэш другого движка для той же версии файла сохраняется)
+            for stale in self.cache_path.glob(f"{filename}-*.feather"):
+                if (not stale.name.startswith(f"{filename}-{fingerprint}-")
+                        or not stale.name.endswith(f"-v{CACHE_VERSION}.feather")):
+                    stale.unlink()
+            feather.write_feather(df.reset_index(drop=True), cache_file, compression='lz4')
         except Exception as e:
-            print(f"Ошибка загрузки withdraw: {e}")
+            print(f"Не удалось сохранить кэш {filename}: {e}")
+        
+        return df
+    
+    def _read_table(self, file_path: Path, usecols: List[str] = None,
+                    schema=None) -> pd.DataFrame:
+        """
+        Читает CSV или XLSX файл в DataFrame
+        
+        CSV читается многопоточным парсером pyarrow (ISO-даты приходят уже
+        в datetime64), при его отсутствии или ошибке - стандартным pandas.
+        XLSX читается медленно, поэтому его содержимое сохраняется
+        в Parquet-копию в папке .cache и берется оттуда, пока файл не изменился.
+        
+        Args:
+            file_path: Путь к файлу
+            usecols: Колонки, которые нужно прочитать из XLSX (остальные
+                     не загружаются; отсутствующие в файле игнорируются)
+            schema: pyarrow.Schema с типами колонок CSV (см. SCHEMAS)
+        
+        Returns:
+            DataFrame с содержимым файла
+        """
+        if file_path.suffix != '.csv':
+            return self._read_excel_cached(file_path, usecols)
+        
+        if PYARROW_AVAILABLE and schema is not None:
+            try:
+                convert_options = pa_csv.ConvertOptions(column_types=schema)
+                return pa_csv.read_csv(file_path, convert_options=convert_options).to_pandas()
+            except pyarrow.ArrowInvalid as e:
+                print(f"Типы колонок {file_path.name} не совпали со схемой: {e}")
+        
+        if PYARROW_AVAILABLE:
+            try:
+                return pd.read_csv(file_path, engine='pyarrow')
+            except Exception:
+                pass
+        
+        return pd.read_csv(file_path)
+    
+    def _read_excel_cached(self, file_path: Path, usecols: List[str] = None) -> pd.DataFrame:
+        """
+        Читает XLSX через Parquet-копию исходного листа
+        
+        Имя копии содержит отпечаток файла (путь, mtime, размер) и набор
+        колонок usecols: изменение или замена файла (в том числе на более
+        старую версию) и другой набор колонок дают промах.
+        
+        Args:
+            file_path: Путь к XLSX файлу
+            usecols: Колонки, которые нужно прочитать
+        
+        Returns:
+            DataFrame с содержимым файла
+        """
+        if not self.use_cache:
+            return self._read_excel(file_path, usecols)
+        
+        fingerprint = self._fingerprint(file_path)
+        columns_key = '\n'.join(sorted(usecols)) if usecols is not None else '*'
+        columns_digest = hashlib.md5(columns_key.encode('utf-8')).hexdigest()[:8]
+        sidecar = self.cache_path / f"{file_path.name}-{fingerprint}-{columns_digest}.parquet"
+        if sidecar.exists():
+            return pd.read_parquet(sidecar, engine='pyarrow')
+        
+        df = self._read_excel(file_path, usecols)
         
-        # Загрузка дефектуры
         try:
-            self.defecture = self._load_defecture("defecture")
-            data['defecture'] = self.defecture
+            self.cache_path.mkdir(exist_ok=True)
+            # Удаляем копии предыдущих версий файла
+            for stale in self.cache_path.glob(f"{file_path.name}-*.parquet"):
+                if not stale.name.startswith(f"{file_path.name}-{fingerprint}-"):
+                    stale.unlink()
+            df.to_parquet(sidecar, engine='pyarrow', compression='zstd', index=False)
         except Exception as e:
-            print(f"Ошибка загрузки defecture: {e}")
+            print(f"Не удалось сохранить Parquet-копию {file_path.name}: {e}")
         
-        return data
+        return df
     
-    def _load_sales(self, filename: str) -> pd.DataFrame:
-        """Загружает данные о продажах"""
-        file_path = self.data_path / f"{filename}.csv"
-        if not file_path.exists():
-            file_path = self.data_path / f"{filename}.xlsx"
+    @staticmethod
+    def _read_excel(file_path: Path, usecols: List[str] = None) -> pd.DataFrame:
+        """
+        Читает XLSX движком calamine (если установлен python-calamine) или openpyxl
         
-        if not file_path.exists():
-            raise FileNotFoundError(f"Файл {filename} не найден")
+        Args:
+            file_path: Путь к XLSX файлу
+            usecols: Колонки, которые нужно прочитать
+        
+        Returns:
+            DataFrame с содержимым файла
+        """
+        engine = 'calamine' if CALAMINE_AVAILABLE else None
+        if usecols is None:
+            return pd.read_excel(file_path, engine=engine)
+        
+        wanted = set(usecols)
+        return pd.read_excel(file_path, engine=engine, usecols=lambda col: col in wanted)
+    
+    def _use_polars(self, file_path: Path) -> bool:
+        """Проверяет, читать ли файл через Polars (поддерживаются только CSV)"""
+        return self.engine == 'polars' and file_path.suffix == '.csv'
+    
+    def _scan_polars(self, file_path: Path, column_mapping: Dict[str, str],
+                     datetime_columns: Tuple[str, ...] = ()):
+        """
+        Строит ленивый план Polars: чтение CSV, обработка даты и переименование колонок
+        
+        Args:
+            file_path: Путь к CSV файлу
+            column_mapping: Словарь переименования колонок
+            datetime_columns: Колонки (после переименования), которые нужно
+                              привести к датам помимо 'Дата'
+        
+        Returns:
+            polars.LazyFrame
+        """
+        lf = pl.scan_csv(file_path)
+        columns = lf.collect_schema().names()
+        
+        # Обработка даты
+        if 'Дата' in columns:
+            lf = lf.with_columns(
+                pl.col('Дата').cast(pl.String).str.to_datetime(strict=False)
+            )
+        elif 'Годы (Дата)' in columns and 'Месяцы (Дата)' in columns:
+            lf = lf.with_columns(
+                pl.date(pl.col('Годы (Дата)'), pl.col('Месяцы (Дата)'), 1)
+                .cast(pl.Datetime)
+                .alias('Дата')
+            )
+        
+        columns = lf.collect_schema().names()
+        lf = lf.rename({old: new for old, new in column_mapping.items() if old in columns})
         
-        df = pd.read_csv(file_path) if file_path.suffix == '.csv' else pd.read_excel(file_path)
+        columns = lf.collect_schema().names()
+        return lf.with_columns([
+            pl.col(col).cast(pl.String).str.to_datetime(strict=False)
+            for col in datetime_columns if col in columns
+        ])
+    
+    def _group_sum_polars(self, lf, aggs: Dict[str, str]):
+        """
+        Группирует LazyFrame по дате и унифицированному коду
+        
+        Args:
+            lf: polars.LazyFrame с переименованными колонками
+            aggs: Словарь {колонка: 'sum' или 'first'}
+        
+        Returns:
+            polars.LazyFrame, отсортированный по ключам как результат pandas groupby
+        """
+        return (
+            lf.drop_nulls(['date', 'unified_code'])
+            .group_by(['date', 'unified_code'])
+            .agg(_polars_agg_exprs(aggs))
+            .sort(['date', 'unified_code'])
+        )
+    
+    def _read_generic(self, file_path: Path, column_mapping: Dict[str, str],
+                      aggs: Dict[str, str] = None,
+                      datetime_columns: Tuple[str, ...] = (),
+                      schema=None) -> pd.DataFrame:
+        """
+        Общий путь загрузки источника: чтение, обработка даты,
+        переименование колонок и группировка по дате и продукту
+        
+        Args:
+            file_path: Путь к CSV или XLSX файлу
+            column_mapping: Словарь переименования колонок
+            aggs: Агрегации {колонка: 'sum' или 'first'} для группировки
+                  по дате и унифицированному коду (None - без группировки)
+            datetime_columns: Колонки (после переименования), которые нужно
+                              привести к датам помимо 'Дата'
+            schema: pyarrow.Schema с типами колонок CSV (см. SCHEMAS)
+        
+        Returns:
+            DataFrame с данными
+        
+        Raises:
+            ValueError: Если для группировки не хватает колонок
+        """
+        # Колонки, без которых группировка невозможна, проверяются один раз
+        # сразу после чтения
+        required = ['date', 'unified_code', *aggs] if aggs else []
+        
+        if self._use_polars(file_path):
+            lf = self._scan_polars(file_path, column_mapping, datetime_columns)
+            if aggs:
+                _require_columns(lf.collect_schema().names(), required, file_path)
+                lf = self._group_sum_polars(lf, aggs)
+            return lf.collect().to_pandas()
+        
+        df = self._read_table(file_path, usecols=list(column_mapping) + DATE_PART_COLUMNS,
+                              schema=schema)
         
         # Обработка даты
         if 'Дата' in df.columns:
-            df['Дата'] = pd.to_datetime(df['Дата'], errors='coerce')
+            df['Дата'] = _fast_to_datetime(df['Дата'])
         elif 'Годы (Дата)' in df.columns and 'Месяцы (Дата)' in df.columns:
-            df['Дата'] = pd.to_datetime(
-                df['Годы (Дата)'].astype(str) + '-' + 
-                df['Месяцы (Дата)'].astype(str).str.zfill(2) + '-01',
-                errors='coerce'
-            )
+            df['Дата'] = _year_month_to_datetime(df['Годы (Дата)'], df['Месяцы (Дата)'])
+        
+        df = df.rename(columns=column_mapping)
+        
+        for col in datetime_columns:
+            if col in df.columns:
+                df[col] = _fast_to_datetime(df[col])
+        
+        # Группировка по дате и унифицированному коду
+        if aggs:
+            _require_columns(df.columns, required, file_path)
+            df = _pl_groupby_agg(df, ['date', 'unified_code'], aggs,
+                                 use_polars=self.engine == 'polars')
+        
+        return df
+    
+    def _load_sales(self, filename: str) -> pd.DataFrame:
+        """Загружает данные о продажах"""
+        file_path = self._resolve_file(filename)
+        if file_path is None:
+            raise FileNotFoundError(f"Файл {filename} не найден")
         
         # Переименование колонок для унификации
         column_mapping = {
@@ -118,41 +559,20 @@ class DataLoader:
             'Дата': 'date'
         }
         
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df = df.rename(columns={old_col: new_col})
+        df = self._read_generic(file_path, column_mapping, aggs={
+            'quantity': 'sum',
+            'sku': 'first',
+            'solo_code': 'first'
+        }, schema=SCHEMAS.get('sales'))
         
-        # Группировка по дате и унифицированному коду
-        if 'quantity' in df.columns and 'unified_code' in df.columns and 'date' in df.columns:
-            df = df.groupby(['date', 'unified_code']).agg({
-                'quantity': 'sum',
-                'sku': 'first',
-                'solo_code': 'first'
-            }).reset_index()
-        
-        return df
+        return _compact_dtypes(df)
     
     def _load_stocks(self, filename: str) -> pd.DataFrame:
         """Загружает данные об остатках на маркетплейсах"""
-        file_path = self.data_path / f"{filename}.csv"
-        if not file_path.exists():
-            file_path = self.data_path / f"{filename}.xlsx"
-        
-        if not file_path.exists():
+        file_path = self._resolve_file(filename)
+        if file_path is None:
             raise FileNotFoundError(f"Файл {filename} не найден")
         
-        df = pd.read_csv(file_path) if file_path.suffix == '.csv' else pd.read_excel(file_path)
-        
-        # Обработка даты
-        if 'Дата' in df.columns:
-            df['Дата'] = pd.to_datetime(df['Дата'], errors='coerce')
-        elif 'Годы (Дата)' in df.columns and 'Месяцы (Дата)' in df.columns:
-            df['Дата'] = pd.to_datetime(
-                df['Годы (Дата)'].astype(str) + '-' + 
-                df['Месяцы (Дата)'].astype(str).str.zfill(2) + '-01',
-                errors='coerce'
-            )
-        
         # Переименование колонок
         column_mapping = {
             'Остаток': 'stock',
@@ -163,33 +583,15 @@ class DataLoader:
             'Дата': 'date'
         }
         
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df = df.rename(columns={old_col: new_col})
-        
-        return df
+        return _compact_dtypes(self._read_generic(file_path, column_mapping,
+                                                  schema=SCHEMAS.get('stocks')))
     
     def _load_our_stocks(self, filename: str) -> pd.DataFrame:
         """Загружает данные об остатках на нашем складе"""
-        file_path = self.data_path / f"{filename}.csv"
-        if not file_path.exists():
-            file_path = self.data_path / f"{filename}.xlsx"
-        
-        if not file_path.exists():
+        file_path = self._resolve_file(filename)
+        if file_path is None:
             raise FileNotFoundError(f"Файл {filename} не найден")
         
-        df = pd.read_csv(file_path) if file_path.suffix == '.csv' else pd.read_excel(file_path)
-        
-        # Обработка даты
-        if 'Дата' in df.columns:
-            df['Дата'] = pd.to_datetime(df['Дата'], errors='coerce')
-        elif 'Годы (Дата)' in df.columns and 'Месяцы (Дата)' in df.columns:
-            df['Дата'] = pd.to_datetime(
-                df['Годы (Дата)'].astype(str) + '-' + 
-                df['Месяцы (Дата)'].astype(str).str.zfill(2) + '-01',
-                errors='coerce'
-            )
-        
         # Переименование колонок
         column_mapping = {
             'Остаток': 'stock',
@@ -198,59 +600,35 @@ class DataLoader:
             'Дата': 'date'
         }
         
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df = df.rename(columns={old_col: new_col})
-        
-        return df
+        return _compact_dtypes(self._read_generic(file_path, column_mapping,
+                                                  schema=SCHEMAS.get('stocks')))
     
     def _load_withdraw(self, filename: str) -> pd.DataFrame:
         """Загружает список продуктов на вывод"""
-        file_path = self.data_path / f"{filename}.csv"
-        if not file_path.exists():
-            file_path = self.data_path / f"{filename}.xlsx"
-        
-        if not file_path.exists():
+        file_path = self._resolve_file(filename)
+        if file_path is None:
             return pd.DataFrame(columns=['unified_code', 'sku'])
         
-        df = pd.read_csv(file_path) if file_path.suffix == '.csv' else pd.read_excel(file_path)
-        
         column_mapping = {
             'Унифицированный solo-code': 'unified_code',
             'SKU': 'sku'
         }
         
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df = df.rename(columns={old_col: new_col})
-        
-        return df
+        return self._read_generic(file_path, column_mapping)
     
     def _load_defecture(self, filename: str) -> pd.DataFrame:
         """Загружает список продуктов в дефектуре"""
-        file_path = self.data_path / f"{filename}.csv"
-        if not file_path.exists():
-            file_path = self.data_path / f"{filename}.xlsx"
-        
-        if not file_path.exists():
+        file_path = self._resolve_file(filename)
+        if file_path is None:
             return pd.DataFrame(columns=['unified_code', 'sku', 'end_date'])
         
-        df = pd.read_csv(file_path) if file_path.suffix == '.csv' else pd.read_excel(file_path)
-        
         column_mapping = {
             'Унифицированный solo-code': 'unified_code',
             'SKU': 'sku',
             'Дата окончания дефектуры': 'end_date'
         }
         
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df = df.rename(columns={old_col: new_col})
-        
-        if 'end_date' in df.columns:
-            df['end_date'] = pd.to_datetime(df['end_date'], errors='coerce')
-        
-        return df
+        return self._read_generic(file_path, column_mapping, datetime_columns=('end_date',))
     
     def load_historical_shipments(self, filename: str = "Отгрузки в МП") -> pd.DataFrame:
         """
@@ -262,20 +640,11 @@ class DataLoader:
         Returns:
             DataFrame с историческими отгрузками
         """
-        file_path = self.data_path / f"{filename}.csv"
-        if not file_path.exists():
-            file_path = self.data_path / f"{filename}.xlsx"
-        
-        if not file_path.exists():
+        file_path = self._resolve_file(filename)
+        if file_path is None:
             print(f"Файл {filename} не найден")
             return pd.DataFrame()
         
-        df = pd.read_csv(file_path) if file_path.suffix == '.csv' else pd.read_excel(file_path)
-        
-        # Обработка даты
-        if 'Дата' in df.columns:
-            df['Дата'] = pd.to_datetime(df['Дата'], errors='coerce')
-        
         # Переименование колонок
         column_mapping = {
             'Унифицированный solo-code': 'unified_code',
@@ -283,15 +652,8 @@ class DataLoader:
             'Дата': 'date'
         }
         
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df = df.rename(columns={old_col: new_col})
-        
-        # Группировка по дате и продукту
-        if 'quantity' in df.columns and 'unified_code' in df.columns and 'date' in df.columns:
-            df = df.groupby(['date', 'unified_code']).agg({
-                'quantity': 'sum'
-            }).reset_index()
+        df = _compact_dtypes(self._read_generic(file_path, column_mapping, aggs={'quantity': 'sum'},
+                                                schema=SCHEMAS.get('shipments')))
         
         self.historical_shipments = df
         return df
@@ -306,10 +668,11 @@ class DataLoader:
         Returns:
             DataFrame с подготовленными данными
         """
+        # Копия не нужна: sort_values возвращает новый DataFrame
         if marketplace == 'wb':
-            sales_df = self.wb_sales.copy() if self.wb_sales is not None else pd.DataFrame()
+            sales_df = self.wb_sales if self.wb_sales is not None else pd.DataFrame()
         else:
-            sales_df = self.ozon_sales.copy() if self.ozon_sales is not None else pd.DataFrame()
+            sales_df = self.ozon_sales if self.ozon_sales is not None else pd.DataFrame()
         
         if sales_df.empty:
             return pd.DataFrame()
@@ -321,14 +684,21 @@ class DataLoader:
     
     def get_product_list(self) -> pd.DataFrame:
         """Возвращает список всех продуктов с унифицированными кодами"""
-        products = set()
-        
-        if self.wb_sales is not None and 'unified_code' in self.wb_sales.columns:
-            products.update(self.wb_sales['unified_code'].unique())
+        codes = []
+        for sales in (self.wb_sales, self.ozon_sales):
+            if sales is None or 'unified_code' not in sales.columns:
+                continue
+            
+            # Для категориальной колонки уникальные коды - это ее категории
+            unified_code = sales['unified_code']
+            if isinstance(unified_code.dtype, pd.CategoricalDtype):
+                codes.append(unified_code.cat.categories.to_numpy())
+            else:
+                codes.append(unified_code.dropna().unique())
         
-        if self.ozon_sales is not None and 'unified_code' in self.ozon_sales.columns:
-            products.update(self.ozon_sales['unified_code'].unique())
+        if not codes:
+            return pd.DataFrame({'unified_code': []})
         
-        return pd.DataFrame({'unified_code': list(products)})
+        return pd.DataFrame({'unified_code': pd.unique(np.concatenate(codes))})
 
 
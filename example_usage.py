@@ -59,8 +59,8 @@ def main():
         print(f"  Общий прогноз продаж: {wb_forecast['quantity'].sum():.0f}")
         
         # Сохраняем в файл
-        wb_forecast.to_csv('wb_forecast.csv', index=False)
-        print("  Сохранено в wb_forecast.csv")
+        wb_forecast.to_parquet('wb_forecast.parquet', index=False)
+        print("  Сохранено в wb_forecast.parquet")
     
     if 'best_forecast' in ozon_results:
         ozon_forecast = ozon_results['best_forecast']
@@ -69,8 +69,8 @@ def main():
         print(f"  Общий прогноз продаж: {ozon_forecast['quantity'].sum():.0f}")
         
         # Сохраняем в файл
-        ozon_forecast.to_csv('ozon_forecast.csv', index=False)
-        print("  Сохранено в ozon_forecast.csv")
+        ozon_forecast.to_parquet('ozon_forecast.parquet', index=False)
+        print("  Сохранено в ozon_forecast.parquet")
     
     # Отгрузки
     if 'shipments' in wb_results and not wb_results['shipments'].empty:
@@ -78,16 +78,16 @@ def main():
         print(f"\nОтгрузки Wildberries:")
         print(f"  Общая отгрузка: {wb_shipments['shipment'].sum():.0f}")
         print(f"  Складов: {wb_shipments['warehouse'].nunique()}")
-        wb_shipments.to_csv('wb_shipments.csv', index=False)
-        print("  Сохранено в wb_shipments.csv")
+        wb_shipments.to_parquet('wb_shipments.parquet', index=False)
+        print("  Сохранено в wb_shipments.parquet")
     
     if 'shipments' in ozon_results and not ozon_results['shipments'].empty:
         ozon_shipments = ozon_results['shipments']
         print(f"\nОтгрузки Ozon:")
         print(f"  Общая отгрузка: {ozon_shipments['shipment'].sum():.0f}")
         print(f"  Складов: {ozon_shipments['warehouse'].nunique()}")
-        ozon_shipments.to_csv('ozon_shipments.csv', index=False)
-        print("  Сохранено в ozon_shipments.csv")
+        ozon_shipments.to_parquet('ozon_shipments.parquet', index=False)
+        print("  Сохранено в ozon_shipments.parquet")
     
     # Оценка моделей
     if 'evaluation_summary' in wb_results:
@@ -95,14 +95,14 @@ def main():
         if not evaluation.empty:
             print("\nОценка моделей (Wildberries):")
             print(evaluation.head(10))
-            evaluation.to_csv('wb_model_evaluation.csv', index=False)
+            evaluation.to_parquet('wb_model_evaluation.parquet', index=False)
     
     if 'best_models_summary' in wb_results:
         best_models = wb_results['best_models_summary']
         if not best_models.empty:
             print("\nЛучшие модели по продуктам (Wildberries):")
             print(best_models.head(10))
-            best_models.to_csv('wb_best_models.csv', index=False)
+            best_models.to_parquet('wb_best_models.parquet', index=False)
     
     # 8. Просмотр истории прогнозов
     print("\nПросмотр истории прогнозов...")
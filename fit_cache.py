@@ -0,0 +1,59 @@
+"""
+Кэш обученных состояний моделей и хэширование обучающих данных
+"""
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+
+# Максимальное количество обученных состояний в кэше модели
+FIT_CACHE_SIZE = 1024
+
+
+def array_digest(*arrays: np.ndarray) -> bytes:
+    """
+    Быстрый хэш содержимого и формы массивов
+    
+    Используется xxhash (если установлен), иначе blake2b.
+    """
+    digest = xxhash.xxh3_64() if XXHASH_AVAILABLE else hashlib.blake2b(digest_size=8)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(repr((array.shape, array.dtype.str)).encode())
+        digest.update(array)
+    return digest.digest()
+
+
+class FitCache:
+    """
+    LRU-кэш обученных состояний моделей
+    
+    Ключ содержит код продукта и хэш обучающих данных, поэтому повторное
+    обучение на тех же данных (например, при повторном запуске прогноза)
+    восстанавливает состояние без пересчета.
+    """
+    
+    def __init__(self, max_size: int = FIT_CACHE_SIZE):
+        self.max_size = max_size
+        self._states = OrderedDict()
+    
+    def get(self, key):
+        """Возвращает сохраненное состояние или None"""
+        state = self._states.get(key)
+        if state is not None:
+            self._states.move_to_end(key)
+        return state
+    
+    def put(self, key, state):
+        """Сохраняет состояние, вытесняя самое старое при переполнении"""
+        self._states[key] = state
+        self._states.move_to_end(key)
+        if len(self._states) > self.max_size:
+            self._states.popitem(last=False)
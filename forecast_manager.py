@@ -5,24 +5,74 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from pathlib import Path
+from fnmatch import fnmatch
 import json
 from typing import Dict, List, Optional
-import warnings
-warnings.filterwarnings('ignore')
+from .data_loader import _pl_groupby_agg
+from .forecast_metrics import mape, rmse, kge
+from .io_utils import _write_csv_fast
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Форматы файлов прогнозов: новые сохраняются в Parquet,
+# старые CSV из истории продолжают читаться
+FORECAST_SUFFIXES = ('.parquet', '.csv')
+
+
+def _parse_forecast_filename(filepath: Path) -> Optional[tuple]:
+    """
+    Извлекает (маркетплейс, модель, дату прогноза) из имени файла
+    
+    Returns:
+        Кортеж из трех строк или None, если имя не соответствует формату
+    """
+    parts = filepath.stem.split('_')
+    if len(parts) < 3:
+        return None
+    return parts[0], parts[1], '_'.join(parts[2:])
+
+
+def _categorize_labels(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Переводит повторяющиеся строковые метки истории прогнозов в категории
+    
+    Кодов продуктов, маркетплейсов и моделей немного, а строк истории
+    много: категории хранят каждую строку один раз, а groupby по ним
+    работает с целочисленными кодами.
+    """
+    for column in ('unified_code', 'marketplace', 'model_name'):
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
 
 
 class ForecastManager:
-    """Класс для управления прогнозами"""
+    """
+    Класс для управления прогнозами
+    
+    Список сохраненных прогнозов (имя файла, время изменения и коды продуктов)
+    хранится в индексе _index.json, поэтому поиск прогнозов не обходит
+    папку и не открывает файлы, в которых нет нужного продукта.
+    """
     
-    def __init__(self, storage_path: str = "forecast_history"):
+    INDEX_FILENAME = '_index.json'
+    
+    def __init__(self, storage_path: str = "forecast_history", format: str = 'parquet'):
         """
         Инициализация
         
         Args:
             storage_path: Путь для хранения исторических прогнозов
+            format: Формат сохранения прогнозов: 'parquet' (нужен pyarrow) или 'csv'
         """
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(exist_ok=True)
+        self.format = 'parquet' if format == 'parquet' and PYARROW_AVAILABLE else 'csv'
     
     def save_forecast(self, forecast: pd.DataFrame, model_name: str,
                      marketplace: str, forecast_date: datetime = None,
@@ -40,12 +90,18 @@ class ForecastManager:
         if forecast_date is None:
             forecast_date = datetime.now()
         
+        # Индекс читаем до записи файлов, пока папка не изменилась
+        index = self._load_index()
+        
         # Создаем имя файла
-        filename = f"{marketplace}_{model_name}_{forecast_date.strftime('%Y%m%d_%H%M%S')}.csv"
+        filename = f"{marketplace}_{model_name}_{forecast_date.strftime('%Y%m%d_%H%M%S')}.{self.format}"
         filepath = self.storage_path / filename
         
         # Сохраняем прогноз
-        forecast.to_csv(filepath, index=False)
+        if self.format == 'parquet':
+            forecast.to_parquet(filepath, engine='pyarrow', compression='zstd', index=False)
+        else:
+            _write_csv_fast(forecast, filepath)
         
         # Сохраняем метаданные
         if metadata:
@@ -54,6 +110,135 @@ class ForecastManager:
             
             with open(metadata_filepath, 'w', encoding='utf-8') as f:
                 json.dump(metadata, f, ensure_ascii=False, indent=2, default=str)
+        
+        # Добавляем прогноз в индекс
+        index = [entry for entry in index if entry['filename'] != filename]
+        index.append(self._make_index_entry(filepath, forecast))
+        self._write_index(index)
+    
+    def _load_index(self) -> List[Dict]:
+        """
+        Загружает индекс прогнозов
+        
+        Индекс перестраивается, если его нет или папка изменилась после
+        его записи (файлы добавлены или удалены не через save_forecast).
+        Перезапись файла на месте не меняет время изменения папки, поэтому
+        записи файлов, время изменения которых отличается от индекса,
+        обновляются по содержимому файла.
+        
+        Returns:
+            Список записей {filename, mtime, unified_codes}
+        """
+        index_path = self.storage_path / self.INDEX_FILENAME
+        if (not index_path.exists() or
+                self.storage_path.stat().st_mtime > index_path.stat().st_mtime):
+            return self._rebuild_index()
+        
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except Exception:
+            return self._rebuild_index()
+        
+        return self._refresh_index(index)
+    
+    def _refresh_index(self, index: List[Dict]) -> List[Dict]:
+        """Обновляет записи измененных файлов и удаляет записи отсутствующих"""
+        refreshed = []
+        changed = False
+        for entry in index:
+            filepath = self.storage_path / entry['filename']
+            try:
+                mtime = filepath.stat().st_mtime
+            except OSError:
+                changed = True
+                continue
+            
+            if mtime != entry['mtime']:
+                changed = True
+                try:
+                    entry = self._make_index_entry(filepath)
+                except Exception as e:
+                    print(f"Ошибка индексации {filepath}: {e}")
+                    continue
+            refreshed.append(entry)
+        
+        if changed:
+            self._write_index(refreshed)
+        return refreshed
+    
+    def _rebuild_index(self) -> List[Dict]:
+        """Строит индекс по всем файлам прогнозов в папке"""
+        index = []
+        for filepath in sorted(self.storage_path.glob("*_*_*.*")):
+            if filepath.suffix not in FORECAST_SUFFIXES:
+                continue
+            try:
+                index.append(self._make_index_entry(filepath))
+            except Exception as e:
+                print(f"Ошибка индексации {filepath}: {e}")
+        
+        self._write_index(index)
+        return index
+    
+    def _make_index_entry(self, filepath: Path, forecast: pd.DataFrame = None) -> Dict:
+        """
+        Создает запись индекса для файла прогноза
+        
+        Args:
+            filepath: Путь к файлу прогноза
+            forecast: Содержимое файла (если уже в памяти)
+        
+        Returns:
+            Словарь {filename, mtime, unified_codes}
+        """
+        if forecast is None:
+            forecast = self._read_forecast_file(filepath)
+        
+        if forecast is not None and 'unified_code' in forecast.columns:
+            unified_codes = sorted({str(code) for code in forecast['unified_code'].dropna().unique()})
+        else:
+            unified_codes = []
+        
+        return {
+            'filename': filepath.name,
+            'mtime': filepath.stat().st_mtime,
+            'unified_codes': unified_codes,
+        }
+    
+    def _write_index(self, index: List[Dict]):
+        """Сохраняет индекс прогнозов"""
+        try:
+            with open(self.storage_path / self.INDEX_FILENAME, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"Не удалось сохранить индекс прогнозов: {e}")
+    
+    @staticmethod
+    def _read_forecast_file(filepath: Path) -> pd.DataFrame:
+        """Читает файл прогноза в формате Parquet или CSV"""
+        if filepath.suffix == '.parquet':
+            return pd.read_parquet(filepath, engine='pyarrow')
+        return pd.read_csv(filepath)
+    
+    def _find_forecast_files(self, pattern: str, unified_code: str = None) -> List[Dict]:
+        """
+        Ищет прогнозы в индексе
+        
+        Args:
+            pattern: Шаблон имени файла без расширения (как для glob)
+            unified_code: Оставить только файлы с этим продуктом
+        
+        Returns:
+            Список подходящих записей индекса
+        """
+        entries = [
+            entry for entry in self._load_index()
+            if any(fnmatch(entry['filename'], pattern + suffix) for suffix in FORECAST_SUFFIXES)
+        ]
+        if unified_code:
+            entries = [entry for entry in entries if str(unified_code) in entry['unified_codes']]
+        return entries
     
     def load_forecast(self, marketplace: str, model_name: str,
                      forecast_date: str = None) -> pd.DataFrame:
@@ -69,20 +254,21 @@ class ForecastManager:
             DataFrame с прогнозом
         """
         if forecast_date:
-            filename = f"{marketplace}_{model_name}_{forecast_date}.csv"
+            pattern = f"{marketplace}_{model_name}_{forecast_date}"
         else:
             # Загружаем последний прогноз
-            pattern = f"{marketplace}_{model_name}_*.csv"
-            files = list(self.storage_path.glob(pattern))
-            if not files:
-                return pd.DataFrame()
-            filename = max(files, key=lambda p: p.stat().st_mtime).name
+            pattern = f"{marketplace}_{model_name}_*"
+        
+        entries = self._find_forecast_files(pattern)
+        if not entries:
+            return pd.DataFrame()
+        filename = max(entries, key=lambda entry: entry['mtime'])['filename']
         
         filepath = self.storage_path / filename
         if not filepath.exists():
             return pd.DataFrame()
         
-        return pd.read_csv(filepath)
+        return self._read_forecast_file(filepath)
     
     def get_forecast_history(self, marketplace: str = None,
                             model_name: str = None,
@@ -100,25 +286,34 @@ class ForecastManager:
         """
         all_forecasts = []
         
-        # Ищем все файлы прогнозов
-        pattern = "*_*_*.csv"
-        if marketplace:
-            pattern = f"{marketplace}_*_*.csv"
-        if model_name:
-            pattern = f"*_{model_name}_*.csv"
+        # Маркетплейс и модель закодированы в имени файла, поэтому
+        # фильтры по ним отсекают файлы еще до чтения
+        pattern = f"{marketplace or '*'}_{model_name or '*'}_*"
+        
+        files = [
+            self.storage_path / entry['filename']
+            for entry in self._find_forecast_files(pattern, unified_code)
+        ]
+        if not files:
+            return pd.DataFrame()
         
-        files = list(self.storage_path.glob(pattern))
+        if PYARROW_AVAILABLE:
+            try:
+                return self._scan_forecast_history(files, unified_code)
+            except Exception:
+                # Файлы с несовместимыми схемами читаем по одному
+                pass
         
         for filepath in files:
             try:
-                forecast = pd.read_csv(filepath)
+                forecast = self._read_forecast_file(filepath)
                 
                 # Извлекаем информацию из имени файла
-                parts = filepath.stem.split('_')
-                if len(parts) >= 3:
-                    forecast['marketplace'] = parts[0]
-                    forecast['model_name'] = parts[1]
-                    forecast['forecast_date'] = '_'.join(parts[2:])
+                file_info = _parse_forecast_filename(filepath)
+                if file_info is not None:
+                    forecast['marketplace'] = file_info[0]
+                    forecast['model_name'] = file_info[1]
+                    forecast['forecast_date'] = file_info[2]
                 
                 all_forecasts.append(forecast)
             except Exception as e:
@@ -128,12 +323,70 @@ class ForecastManager:
             return pd.DataFrame()
         
         result = pd.concat(all_forecasts, ignore_index=True)
+        if 'date' in result.columns:
+            result['date'] = pd.to_datetime(result['date'], errors='coerce')
         
         # Применяем фильтры
         if unified_code:
             result = result[result['unified_code'] == unified_code]
         
-        return result
+        return _categorize_labels(result)
+    
+    def _scan_forecast_history(self, files: List[Path],
+                               unified_code: str = None) -> pd.DataFrame:
+        """
+        Читает файлы прогнозов одним сканированием pyarrow.dataset
+        
+        Фильтр по продукту применяется при чтении, поэтому в память
+        попадают только нужные строки. Файлы Parquet и CSV сканируются
+        отдельными наборами.
+        
+        Args:
+            files: Список файлов прогнозов
+            unified_code: Фильтр по продукту
+        
+        Returns:
+            DataFrame с историей прогнозов
+        """
+        row_filter = None
+        if unified_code:
+            row_filter = ds.field('unified_code') == unified_code
+        
+        tables = []
+        for suffix in FORECAST_SUFFIXES:
+            paths = [str(f) for f in files if f.suffix == suffix]
+            if not paths:
+                continue
+            dataset = ds.dataset(paths, format=suffix.lstrip('.'))
+            table = dataset.to_table(columns=dataset.schema.names + ['__filename'],
+                                     filter=row_filter)
+            
+            # CSV дает date32, Parquet - timestamp: приводим к одному типу
+            date_index = table.schema.get_field_index('date')
+            if date_index >= 0 and pa.types.is_date(table.schema.field(date_index).type):
+                table = table.set_column(date_index, 'date',
+                                         table.column(date_index).cast(pa.timestamp('us')))
+            tables.append(table)
+        
+        # Склейка таблиц Arrow не копирует данные, а только объединяет чанки;
+        # в pandas конвертируем один раз, освобождая память Arrow по ходу
+        table = pa.concat_tables(tables, promote_options='permissive')
+        result = table.to_pandas(split_blocks=True, self_destruct=True)
+        del table
+        if 'date' in result.columns:
+            result['date'] = pd.to_datetime(result['date'], errors='coerce')
+        
+        # Информацию из имени файла разбираем один раз на файл
+        filenames = result.pop('__filename')
+        file_info = {
+            name: _parse_forecast_filename(Path(name))
+            for name in filenames.unique()
+        }
+        for i, column in enumerate(['marketplace', 'model_name', 'forecast_date']):
+            values = {name: info[i] for name, info in file_info.items() if info is not None}
+            result[column] = filenames.map(values)
+        
+        return _categorize_labels(result)
     
     def compare_forecasts(self, marketplace: str, unified_code: str,
                          actual_sales: pd.DataFrame = None) -> pd.DataFrame:
@@ -158,9 +411,9 @@ class ForecastManager:
             return pd.DataFrame()
         
         # Группируем по моделям и датам
-        comparison = forecasts.groupby(['model_name', 'date']).agg({
+        comparison = _pl_groupby_agg(forecasts, ['model_name', 'date'], {
             'quantity': 'mean'  # Если несколько прогнозов, берем среднее
-        }).reset_index()
+        })
         
         # Если есть реальные продажи, добавляем их
         if actual_sales is not None and not actual_sales.empty:
@@ -174,6 +427,56 @@ class ForecastManager:
         
         return comparison
     
+    def evaluate_forecast_history(self, marketplace: str, actual_sales: pd.DataFrame,
+                                  model_name: str = None) -> pd.DataFrame:
+        """
+        Оценивает точность сохраненных прогнозов по реальным продажам
+        
+        Для каждой пары (модель, продукт) прогнозы и факт раскладываются
+        в строки матриц по датам, а MAPE, RMSE и KGE считаются сразу
+        для всех строк.
+        
+        Args:
+            marketplace: Маркетплейс
+            actual_sales: Реальные продажи (date, unified_code, quantity)
+            model_name: Фильтр по модели
+        
+        Returns:
+            DataFrame с колонками model_name, unified_code, mape, rmse, kge
+        """
+        columns = ['model_name', 'unified_code', 'mape', 'rmse', 'kge']
+        if actual_sales is None or actual_sales.empty:
+            return pd.DataFrame(columns=columns)
+        
+        history = self.get_forecast_history(marketplace=marketplace, model_name=model_name)
+        if history.empty:
+            return pd.DataFrame(columns=columns)
+        
+        # Если несколько прогнозов на одну дату, берем среднее, как в compare_forecasts
+        forecasts = _pl_groupby_agg(history, ['model_name', 'unified_code', 'date'], {
+            'quantity': 'mean'
+        })
+        actual = actual_sales.groupby(['unified_code', 'date'])['quantity'].sum().rename('actual')
+        merged = forecasts.join(actual, on=['unified_code', 'date'], how='inner')
+        if merged.empty:
+            return pd.DataFrame(columns=columns)
+        
+        # Матрицы (модель, продукт) x дата, отсутствующие даты - NaN
+        forecast_matrix = merged.pivot_table(index=['model_name', 'unified_code'],
+                                             columns='date', values='quantity')
+        actual_matrix = merged.pivot_table(index=['model_name', 'unified_code'],
+                                           columns='date', values='actual')
+        actual_matrix = actual_matrix.reindex_like(forecast_matrix)
+        
+        y_pred = forecast_matrix.to_numpy(dtype=np.float64)
+        y_true = actual_matrix.to_numpy(dtype=np.float64)
+        
+        return pd.DataFrame({
+            'mape': mape(y_true, y_pred),
+            'rmse': rmse(y_true, y_pred),
+            'kge': kge(y_true, y_pred),
+        }, index=forecast_matrix.index).reset_index()
+    
     def get_forecast_metadata(self, marketplace: str, model_name: str,
                              forecast_date: str) -> Dict:
         """
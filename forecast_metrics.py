@@ -0,0 +1,106 @@
+"""
+Метрики точности прогнозов по историческим данным (MAPE, RMSE, KGE)
+
+Функции работают как обобщенные ufunc с сигнатурой (n),(n)->(): для
+матриц размера (k, n) метрика считается по каждой строке. Пары, где
+одно из значений не конечно (NaN), пропускаются, поэтому ряды разной
+длины можно передавать одной матрицей, дополненной NaN.
+"""
+import numpy as np
+
+try:
+    from numba import guvectorize, float64
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _mape_kernel(y_true, y_pred, out):
+    """MAPE в процентах по парам с положительным фактом"""
+    total = 0.0
+    count = 0
+    for i in range(y_true.shape[0]):
+        if np.isfinite(y_true[i]) and np.isfinite(y_pred[i]) and y_true[i] > 0:
+            total += abs((y_true[i] - y_pred[i]) / y_true[i])
+            count += 1
+    out[0] = total / count * 100 if count > 0 else np.inf
+
+
+def _rmse_kernel(y_true, y_pred, out):
+    """Среднеквадратичная ошибка"""
+    total = 0.0
+    count = 0
+    for i in range(y_true.shape[0]):
+        if np.isfinite(y_true[i]) and np.isfinite(y_pred[i]):
+            diff = y_true[i] - y_pred[i]
+            total += diff * diff
+            count += 1
+    out[0] = np.sqrt(total / count) if count > 0 else np.inf
+
+
+def _kge_kernel(y_true, y_pred, out):
+    """Kling-Gupta efficiency: 1 - sqrt((r-1)^2 + (alpha-1)^2 + (beta-1)^2)"""
+    count = 0
+    sum_true = 0.0
+    sum_pred = 0.0
+    for i in range(y_true.shape[0]):
+        if np.isfinite(y_true[i]) and np.isfinite(y_pred[i]):
+            sum_true += y_true[i]
+            sum_pred += y_pred[i]
+            count += 1
+    
+    if count < 2:
+        out[0] = -np.inf
+        return
+    
+    mean_true = sum_true / count
+    mean_pred = sum_pred / count
+    var_true = 0.0
+    var_pred = 0.0
+    cov = 0.0
+    for i in range(y_true.shape[0]):
+        if np.isfinite(y_true[i]) and np.isfinite(y_pred[i]):
+            dt = y_true[i] - mean_true
+            dp = y_pred[i] - mean_pred
+            var_true += dt * dt
+            var_pred += dp * dp
+            cov += dt * dp
+    
+    if var_true == 0 or var_pred == 0 or mean_true == 0:
+        out[0] = -np.inf
+        return
+    
+    r = cov / np.sqrt(var_true * var_pred)
+    alpha = np.sqrt(var_pred / var_true)
+    beta = mean_pred / mean_true
+    out[0] = 1 - np.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2)
+
+
+def _rowwise(kernel):
+    """Построчное применение ядра без numba (та же сигнатура (n),(n)->())"""
+    def metric(y_true, y_pred):
+        y_true, y_pred = np.broadcast_arrays(np.asarray(y_true, dtype=np.float64),
+                                             np.asarray(y_pred, dtype=np.float64))
+        flat_true = y_true.reshape(-1, y_true.shape[-1])
+        flat_pred = y_pred.reshape(-1, y_pred.shape[-1])
+        
+        out = np.empty(flat_true.shape[0])
+        for i in range(flat_true.shape[0]):
+            kernel(flat_true[i], flat_pred[i], out[i:i + 1])
+        
+        out = out.reshape(y_true.shape[:-1])
+        return out[()] if out.ndim == 0 else out
+    
+    metric.__doc__ = kernel.__doc__
+    return metric
+
+
+if NUMBA_AVAILABLE:
+    _signature = [(float64[:], float64[:], float64[:])]
+    mape = guvectorize(_signature, '(n),(n)->()', nopython=True, cache=True)(_mape_kernel)
+    rmse = guvectorize(_signature, '(n),(n)->()', nopython=True, cache=True)(_rmse_kernel)
+    kge = guvectorize(_signature, '(n),(n)->()', nopython=True, cache=True)(_kge_kernel)
+else:
+    mape = _rowwise(_mape_kernel)
+    rmse = _rowwise(_rmse_kernel)
+    kge = _rowwise(_kge_kernel)
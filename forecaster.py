@@ -1,44 +1,364 @@
 """
 Главный модуль для прогнозирования продаж и отгрузок
 """
+import os
+import multiprocessing
+from functools import lru_cache
 import pandas as pd
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 import warnings
 warnings.filterwarnings('ignore')
 
 try:
-    import holidays
-    HOLIDAYS_AVAILABLE = True
+    from threadpoolctl import threadpool_limits
+    THREADPOOLCTL_AVAILABLE = True
 except ImportError:
-    HOLIDAYS_AVAILABLE = False
+    THREADPOOLCTL_AVAILABLE = False
+
+# Copy-on-Write: срезы по продуктам и производные DataFrame не копируют
+# данные до первой записи (в pandas >= 3.0 включен всегда)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
 
 from .data_loader import DataLoader
 from .calendar_features import CalendarFeatures
 from .models.baseline import BaselineModel
 from .models.linear_regression import LinearRegressionModel, BinaryLinearRegressionModel
-from .models.arima import ARIMAModel, SARIMAXModel
-from .models.prophet import ProphetModel
 from .model_evaluator import ModelEvaluator
 from .shipment_calculator import ShipmentCalculator
 from .constraints import Constraints
 from .forecast_manager import ForecastManager
 
 
+def _monthly_sum(forecast: pd.DataFrame) -> pd.DataFrame:
+    """
+    Суммирует прогноз по месяцам и продуктам
+    
+    Месяц и код продукта объединяются в один целочисленный ключ
+    (номер месяца * число кодов + код категории), строки сортируются
+    по ключу один раз и суммируются np.add.reduceat. Результат совпадает
+    с groupby([месяц, unified_code]).sum(): отсортирован по месяцу и коду,
+    строки без даты или кода отбрасываются.
+    
+    Args:
+        forecast: DataFrame с колонками 'date', 'unified_code', 'quantity'
+    
+    Returns:
+        DataFrame с колонками 'date' (первое число месяца), 'unified_code', 'quantity'
+    """
+    dates = pd.to_datetime(forecast['date']).to_numpy()
+    date_dtype = dates.dtype
+    months = dates.astype('datetime64[M]')
+    unified_code = forecast['unified_code']
+    categorical = pd.Categorical(unified_code)
+    codes = categorical.codes.astype(np.int64)
+    n_codes = max(len(categorical.categories), 1)
+    
+    valid = (codes >= 0) & ~np.isnat(months)
+    key = months[valid].astype(np.int64) * n_codes + codes[valid]
+    quantity = forecast['quantity'].to_numpy()[valid]
+    if quantity.dtype.kind == 'f':
+        quantity = np.nan_to_num(quantity)
+    
+    if len(key) == 0:
+        return pd.DataFrame({
+            'date': pd.Series(dtype=date_dtype),
+            'unified_code': unified_code.iloc[:0].reset_index(drop=True),
+            'quantity': quantity
+        })
+    
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(key)) + 1]
+    sums = np.add.reduceat(quantity[order], starts)
+    
+    group_key = key[starts]
+    group_codes = group_key % n_codes
+    if isinstance(unified_code.dtype, pd.CategoricalDtype):
+        group_codes = pd.Categorical.from_codes(group_codes, dtype=unified_code.dtype)
+    else:
+        group_codes = categorical.categories.to_numpy()[group_codes]
+    
+    return pd.DataFrame({
+        'date': (group_key // n_codes).astype('datetime64[M]').astype(date_dtype),
+        'unified_code': group_codes,
+        'quantity': sums
+    })
+
+
+@lru_cache(maxsize=256)
+def _future_dates(last_date: pd.Timestamp, periods: int) -> np.ndarray:
+    """
+    Дневные даты прогноза после last_date
+    
+    Кэшируется между вызовами forecast_sales (маркетплейсы, повторные
+    запуски): последние даты продаж у продуктов обычно совпадают.
+    Массив возвращается только для чтения, так как он общий для вызовов.
+    """
+    dates = pd.date_range(start=last_date + timedelta(days=1), periods=periods, freq='D').to_numpy()
+    dates.setflags(write=False)
+    return dates
+
+
+def _build_future_frame(last_date: pd.Timestamp, calendar_features: CalendarFeatures,
+                        marketplace: str, forecast_months: int) -> pd.DataFrame:
+    """
+    Создает будущие даты после last_date с календарными признаками
+    
+    Args:
+        last_date: Последняя дата продаж
+        calendar_features: Генератор календарных признаков
+        marketplace: 'wb' или 'ozon'
+        forecast_months: Количество месяцев для прогноза
+    
+    Returns:
+        DataFrame с колонкой 'date' и календарными признаками
+    """
+    future_df = pd.DataFrame({'date': _future_dates(last_date, forecast_months * 30)})
+    return calendar_features.add_calendar_features(
+        future_df, marketplace=marketplace
+    )
+
+
+def _prepare_product(product: str, product_data: pd.DataFrame,
+                     future_template: pd.DataFrame, calendar_features: CalendarFeatures,
+                     marketplace: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Готовит данные продукта для моделей
+    
+    Returns:
+        Кортеж (продажи с календарными признаками, будущие даты с признаками)
+    """
+    # Добавляем календарные признаки
+    product_data = calendar_features.add_calendar_features(
+        product_data, marketplace=marketplace
+    )
+    
+    # Будущие даты общие для продуктов с одной последней датой продаж
+    future_df = future_template.assign(unified_code=product)
+    return product_data, future_df
+
+
+def _forecast_product(product: str, product_data: pd.DataFrame,
+                      future_template: pd.DataFrame, models: Dict,
+                      calendar_features: CalendarFeatures, evaluator: ModelEvaluator,
+                      marketplace: str, forecast_months: int,
+                      evaluate: bool) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Прогнозирует продажи одного продукта всеми моделями
+    
+    Args:
+        product: Унифицированный код продукта
+        product_data: Исторические продажи продукта
+        future_template: Будущие даты с календарными признаками
+                         (см. _build_future_frame)
+        models: Словарь {model_name: модель}
+        calendar_features: Генератор календарных признаков
+        evaluator: Оценщик моделей (результаты оценки сохраняются в нем)
+        marketplace: 'wb' или 'ozon'
+        forecast_months: Количество месяцев для прогноза
+        evaluate: Оценивать ли модели
+    
+    Returns:
+        Словарь {model_name: (даты прогноза, значения прогноза)}
+    """
+    product_data, future_df = _prepare_product(product, product_data, future_template,
+                                               calendar_features, marketplace)
+    return _forecast_prepared(product, product_data, future_df, models, evaluator,
+                              forecast_months, evaluate)
+
+
+def _forecast_prepared(product: str, product_data: pd.DataFrame,
+                       future_df: pd.DataFrame, models: Dict,
+                       evaluator: ModelEvaluator, forecast_months: int,
+                       evaluate: bool) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Прогнозирует продукт всеми моделями по подготовленным данным
+    
+    Args:
+        product: Унифицированный код продукта
+        product_data: Продажи продукта с календарными признаками
+        future_df: Будущие даты продукта с календарными признаками
+        models: Словарь {model_name: модель}
+        evaluator: Оценщик моделей (результаты оценки сохраняются в нем)
+        forecast_months: Количество месяцев для прогноза
+        evaluate: Оценивать ли модели
+    
+    Returns:
+        Словарь {model_name: (даты прогноза, значения прогноза)}
+    """
+    print(f"  Прогнозирование для продукта {product}...")
+    
+    future_dates = future_df['date'].to_numpy()
+    
+    # Прогнозирование каждой моделью
+    product_forecasts = {}
+    
+    # Применимость моделей проверяется заранее: для слишком короткого ряда
+    # модель дала бы нулевой прогноз, поэтому fit/predict не вызываются
+    n_obs = len(product_data) if 'quantity' in product_data.columns else 0
+    
+    for model_name, model in models.items():
+        if n_obs < getattr(model, 'min_obs', 1):
+            product_forecasts[model_name] = (future_dates[:forecast_months], np.zeros(forecast_months))
+            continue
+        
+        try:
+            # Обучение модели
+            if model_name in ['linear_regression', 'binary_linear_regression']:
+                model.fit(product_data, product)
+                forecast_values = model.predict(product, future_df, periods=forecast_months)
+            elif model_name == 'sarimax':
+                # Для SARIMAX нужны экзогенные переменные
+                exog_cols = [col for col in product_data.columns 
+                           if col.startswith('is_') or col.startswith('month_')]
+                if exog_cols:
+                    model.fit(product_data, product, exog_columns=exog_cols)
+                    future_exog = future_df[exog_cols]
+                    forecast_values = model.predict(product, future_exog, periods=forecast_months)
+                else:
+                    forecast_values = np.zeros(forecast_months)
+            else:
+                model.fit(product_data, product)
+                forecast_values = model.predict(product, periods=forecast_months)
+            
+            # DataFrame с прогнозом собирается один раз на модель
+            # в forecast_sales, здесь сохраняются только массивы
+            forecast_values = np.asarray(forecast_values)
+            if len(forecast_values) > len(future_dates):
+                raise ValueError(f"Прогноз длиннее горизонта: {len(forecast_values)} > {len(future_dates)}")
+            
+            product_forecasts[model_name] = (future_dates[:len(forecast_values)], forecast_values)
+            
+            # Оценка модели (если нужно)
+            if evaluate and len(product_data) > 10:
+                try:
+                    evaluator.cross_validate(
+                        product_data, model, product
+                    )
+                except Exception as e:
+                    print(f"    Ошибка оценки модели {model_name}: {e}")
+            
+        except Exception as e:
+            print(f"    Ошибка прогнозирования моделью {model_name} для {product}: {e}")
+            continue
+    
+    return product_forecasts
+
+
+# Общие для всех задач данные процесса-исполнителя (заполняет _init_worker)
+_WORKER_STATE = {}
+
+
+def _init_worker(model_specs: Dict[str, Tuple[type, Dict]],
+                 calendar_features: CalendarFeatures,
+                 future_templates: Dict[pd.Timestamp, pd.DataFrame],
+                 marketplace: str, forecast_months: int, evaluate: bool):
+    """
+    Инициализатор процесса пула
+    
+    Данные, общие для всех продуктов (спецификации моделей, календарь,
+    шаблоны будущих дат), передаются в процесс один раз при его запуске,
+    а не сериализуются заново в каждой задаче. Модели создаются здесь же
+    по спецификациям (statsmodels и prophet нельзя безопасно передавать
+    между процессами): модули моделей импортируются при распаковке
+    спецификаций, то есть один раз на процесс, и объекты моделей
+    переиспользуются задачами так же, как при последовательном прогнозе.
+    """
+    # Модули моделей импортируются в процессе впервые (spawn), и statsmodels
+    # при импорте включает свои предупреждения - отключаем их, как в родителе
+    warnings.filterwarnings('ignore')
+    # BLAS в процессах пула ограничивается одним потоком, чтобы процессы
+    # не конкурировали за ядра (последовательный прогноз использует все потоки)
+    if THREADPOOLCTL_AVAILABLE:
+        threadpool_limits(1)
+    _WORKER_STATE.update(
+        models={name: cls(**kwargs) for name, (cls, kwargs) in model_specs.items()},
+        calendar_features=calendar_features,
+        future_templates=future_templates,
+        marketplace=marketplace,
+        forecast_months=forecast_months,
+        evaluate=evaluate
+    )
+
+
+def _forecast_product_task(product: str, product_data: pd.DataFrame,
+                           last_date: pd.Timestamp) -> Tuple[Dict, Dict]:
+    """
+    Задача пула процессов: прогноз одного продукта моделями процесса
+    
+    Args:
+        product: Унифицированный код продукта
+        product_data: Исторические продажи продукта
+        last_date: Последняя дата продаж (ключ шаблона будущих дат)
+    
+    Returns:
+        Кортеж (словарь прогнозов {model_name: (даты, значения)},
+                результаты оценки моделей для ModelEvaluator)
+    """
+    state = _WORKER_STATE
+    evaluator = ModelEvaluator()
+    forecasts = _forecast_product(product, product_data, state['future_templates'][last_date],
+                                  state['models'], state['calendar_features'], evaluator,
+                                  state['marketplace'], state['forecast_months'],
+                                  state['evaluate'])
+    return forecasts, evaluator.evaluation_results
+
+
+def _forecasts_frame(model_name: str,
+                     parts: List[Tuple[str, np.ndarray, np.ndarray]],
+                     categories: pd.Index) -> pd.DataFrame:
+    """
+    Собирает прогнозы одной модели по всем продуктам в один DataFrame
+    
+    Вместо DataFrame на каждую пару (продукт, модель) и их concat
+    массивы склеиваются один раз. Коды продуктов и название модели
+    хранятся категориями: строки ссылаются на них целочисленными кодами.
+    
+    Args:
+        model_name: Название модели
+        parts: Список (unified_code, даты прогноза, значения прогноза)
+        categories: Коды всех продуктов (общие категории для всех моделей)
+    
+    Returns:
+        DataFrame с колонками date, unified_code, quantity, model_name
+    """
+    lengths = [len(values) for _, _, values in parts]
+    code_idx = categories.get_indexer([product for product, _, _ in parts])
+    n_rows = sum(lengths)
+    
+    return pd.DataFrame({
+        'date': np.concatenate([dates for _, dates, _ in parts]),
+        'unified_code': pd.Categorical.from_codes(np.repeat(code_idx, lengths),
+                                                  categories=categories),
+        'quantity': np.concatenate([values for _, _, values in parts]),
+        'model_name': pd.Categorical.from_codes(np.zeros(n_rows, dtype=np.int8),
+                                                categories=[model_name])
+    })
+
+
 class SalesForecaster:
     """Главный класс для прогнозирования продаж и отгрузок"""
     
-    def __init__(self, data_path: str = "data", forecast_months: int = 18):
+    def __init__(self, data_path: str = "data", forecast_months: int = 18,
+                 n_jobs: int = -1):
         """
         Инициализация
         
         Args:
             data_path: Путь к данным
             forecast_months: Количество месяцев для прогноза
+            n_jobs: Количество процессов для прогнозирования продуктов
+                    (-1 - все ядра, 1 - последовательно в текущем процессе).
+                    Обучение моделей не зависит от порядка обработки
+                    продуктов, поэтому прогнозы совпадают при любом n_jobs
         """
         self.data_path = data_path
         self.forecast_months = forecast_months
+        self.n_jobs = n_jobs
         
         # Инициализация компонентов
         self.data_loader = DataLoader(data_path)
@@ -51,6 +371,8 @@ class SalesForecaster:
         # Данные
         self.data = {}
         self.models = {}
+        # Спецификации моделей {model_name: (класс, параметры)} для пула процессов
+        self.model_specs = {}
         
     def load_data(self):
         """Загружает все данные"""
@@ -63,22 +385,25 @@ class SalesForecaster:
         print("Подготовка моделей...")
         
         # Baseline модели
-        self.models['baseline_mean'] = BaselineModel(method='mean')
-        self.models['baseline_median'] = BaselineModel(method='median')
-        self.models['baseline_last'] = BaselineModel(method='last')
+        self._add_model('baseline_mean', BaselineModel, method='mean')
+        self._add_model('baseline_median', BaselineModel, method='median')
+        self._add_model('baseline_last', BaselineModel, method='last')
         
         # Линейная регрессия
-        self.models['linear_regression'] = LinearRegressionModel(use_feature_selection=True)
-        self.models['binary_linear_regression'] = BinaryLinearRegressionModel()
+        self._add_model('linear_regression', LinearRegressionModel, use_feature_selection=True)
+        self._add_model('binary_linear_regression', BinaryLinearRegressionModel)
         
-        # ARIMA модели
+        # ARIMA модели (statsmodels импортируется только при подготовке моделей)
         try:
-            self.models['arima'] = ARIMAModel(order=(1, 1, 1))
-            self.models['sarima'] = ARIMAModel(
+            from .models.arima import ARIMAModel, SARIMAXModel
+            self._add_model('arima', ARIMAModel, order=(1, 1, 1))
+            self._add_model(
+                'sarima', ARIMAModel,
                 order=(1, 1, 1),
                 seasonal_order=(1, 1, 1, 12)
             )
-            self.models['sarimax'] = SARIMAXModel(
+            self._add_model(
+                'sarimax', SARIMAXModel,
                 order=(1, 1, 1),
                 seasonal_order=(1, 1, 1, 12)
             )
@@ -87,43 +412,52 @@ class SalesForecaster:
         
         # Prophet
         try:
+            from .models.prophet import ProphetModel
             # Подготовка праздников для Prophet
             holidays_df = self._prepare_prophet_holidays()
-            self.models['prophet'] = ProphetModel(holidays=holidays_df)
+            self._add_model('prophet', ProphetModel, holidays=holidays_df)
         except ImportError:
             print("Prophet модель недоступна (prophet не установлен)")
         
         print(f"Подготовлено {len(self.models)} моделей")
     
-    def _prepare_prophet_holidays(self) -> pd.DataFrame:
-        """Подготавливает праздники для Prophet"""
-        holidays_list = []
+    def _add_model(self, model_name: str, model_class: type, **kwargs):
+        """
+        Создает модель и запоминает ее спецификацию
         
-        if not HOLIDAYS_AVAILABLE:
-            return None
+        По спецификации модель пересоздается в процессах-исполнителях.
         
-        # Российские праздники
-        ru_holidays = holidays.Russia(years=range(2020, 2030))
-        for date, name in ru_holidays.items():
-            holidays_list.append({
-                'ds': pd.Timestamp(date),
-                'holiday': name
-            })
+        Args:
+            model_name: Название модели
+            model_class: Класс модели
+            **kwargs: Параметры конструктора
+        """
+        self.models[model_name] = model_class(**kwargs)
+        self.model_specs[model_name] = (model_class, kwargs)
+    
+    def _prepare_prophet_holidays(self) -> pd.DataFrame:
+        """Подготавливает праздники для Prophet"""
+        # Российские праздники (общий объект календарных признаков)
+        ru_holidays = self.calendar_features.ru_holidays
+        ru_ds = np.array(list(ru_holidays.keys()), dtype='datetime64[ns]')
+        ru_name = np.array(list(ru_holidays.values()), dtype=object)
         
         # Черная пятница
-        for bf_date in self.calendar_features.ozon_black_friday_dates:
-            holidays_list.append({
-                'ds': bf_date,
-                'holiday': 'Black Friday Ozon'
-            })
+        ozon_bf = np.array(self.calendar_features.ozon_black_friday_dates, dtype='datetime64[ns]')
+        wb_bf = np.array(self.calendar_features.wb_black_friday_dates, dtype='datetime64[ns]')
+        
+        # Колонки склеиваются из массивов и передаются в один конструктор
+        ds = np.concatenate([ru_ds, ozon_bf, wb_bf])
+        if len(ds) == 0:
+            return None
         
-        for bf_date in self.calendar_features.wb_black_friday_dates:
-            holidays_list.append({
-                'ds': bf_date,
-                'holiday': 'Black Friday WB'
-            })
+        holiday = np.concatenate([
+            ru_name,
+            np.full(len(ozon_bf), 'Black Friday Ozon', dtype=object),
+            np.full(len(wb_bf), 'Black Friday WB', dtype=object)
+        ])
         
-        return pd.DataFrame(holidays_list) if holidays_list else None
+        return pd.DataFrame({'ds': ds, 'holiday': holiday})
     
     def forecast_sales(self, marketplace: str = 'wb', 
                       unified_code: str = None,
@@ -153,95 +487,141 @@ class SalesForecaster:
         else:
             products = sales_data['unified_code'].unique()
         
-        all_forecasts = {}
+        # Данные разбиваются по продуктам одним проходом groupby
+        sales_groups = dict(list(sales_data.groupby('unified_code', sort=False, observed=True)))
+        products = [product for product in products if product in sales_groups]
+        
+        # Будущие даты и их календарные признаки зависят только от последней
+        # даты продаж, поэтому строятся один раз на каждую различную дату
+        last_dates = {product: sales_groups[product]['date'].max() for product in products}
+        future_templates = {
+            last_date: _build_future_frame(last_date, self.calendar_features,
+                                           marketplace, self.forecast_months)
+            for last_date in set(last_dates.values())
+        }
         
-        for product in products:
-            print(f"  Прогнозирование для продукта {product}...")
-            
-            # Данные продукта
-            product_data = sales_data[sales_data['unified_code'] == product].copy()
-            if product_data.empty:
-                continue
-            
-            # Добавляем календарные признаки
-            product_data = self.calendar_features.add_calendar_features(
-                product_data, marketplace=marketplace
+        n_jobs = (os.cpu_count() or 1) if self.n_jobs == -1 else self.n_jobs
+        if n_jobs > 1 and len(products) > 1:
+            product_results = self._forecast_products_parallel(
+                products, sales_groups, last_dates, future_templates, marketplace, evaluate, n_jobs
             )
-            
-            # Создаем будущие даты
-            last_date = product_data['date'].max()
-            future_dates = pd.date_range(
-                start=last_date + timedelta(days=1),
-                periods=self.forecast_months * 30,
-                freq='D'
-            )[:self.forecast_months * 30]
-            
-            future_df = pd.DataFrame({'date': future_dates})
-            future_df = self.calendar_features.add_calendar_features(
-                future_df, marketplace=marketplace
+        else:
+            product_results = self._forecast_products_sequential(
+                products, sales_groups, last_dates, future_templates, marketplace, evaluate
             )
-            future_df['unified_code'] = product
-            
-            # Прогнозирование каждой моделью
-            product_forecasts = {}
-            
-            for model_name, model in self.models.items():
-                try:
-                    # Обучение модели
-                    if model_name in ['linear_regression', 'binary_linear_regression']:
-                        model.fit(product_data, product)
-                        forecast_values = model.predict(product, future_df, periods=self.forecast_months)
-                    elif model_name == 'sarimax':
-                        # Для SARIMAX нужны экзогенные переменные
-                        exog_cols = [col for col in product_data.columns 
-                                   if col.startswith('is_') or col.startswith('month_')]
-                        if exog_cols:
-                            model.fit(product_data, product, exog_columns=exog_cols)
-                            future_exog = future_df[exog_cols]
-                            forecast_values = model.predict(product, future_exog, periods=self.forecast_months)
-                        else:
-                            forecast_values = np.zeros(self.forecast_months)
-                    else:
-                        model.fit(product_data, product)
-                        forecast_values = model.predict(product, periods=self.forecast_months)
-                    
-                    # Создаем DataFrame с прогнозом
-                    forecast_df = pd.DataFrame({
-                        'date': future_dates[:len(forecast_values)],
-                        'unified_code': product,
-                        'quantity': forecast_values,
-                        'model_name': model_name
-                    })
-                    
-                    product_forecasts[model_name] = forecast_df
-                    
-                    # Оценка модели (если нужно)
-                    if evaluate and len(product_data) > 10:
-                        try:
-                            self.evaluator.cross_validate(
-                                product_data, model, product
-                            )
-                        except Exception as e:
-                            print(f"    Ошибка оценки модели {model_name}: {e}")
-                    
-                except Exception as e:
-                    print(f"    Ошибка прогнозирования моделью {model_name} для {product}: {e}")
-                    continue
-            
+        
+        all_forecasts = {}
+        
+        for product, product_forecasts in product_results:
             # Сохраняем прогнозы
-            for model_name, forecast_df in product_forecasts.items():
+            for model_name, (dates, values) in product_forecasts.items():
                 if model_name not in all_forecasts:
                     all_forecasts[model_name] = []
-                all_forecasts[model_name].append(forecast_df)
+                all_forecasts[model_name].append((product, dates, values))
         
         # Объединяем прогнозы
+        categories = pd.Index(products)
         result = {}
-        for model_name, forecasts_list in all_forecasts.items():
-            if forecasts_list:
-                result[model_name] = pd.concat(forecasts_list, ignore_index=True)
+        for model_name, parts in all_forecasts.items():
+            if parts:
+                result[model_name] = _forecasts_frame(model_name, parts, categories)
         
         return result
     
+    def _forecast_products_sequential(self, products: List[str],
+                                      sales_groups: Dict[str, pd.DataFrame],
+                                      last_dates: Dict[str, pd.Timestamp],
+                                      future_templates: Dict[pd.Timestamp, pd.DataFrame],
+                                      marketplace: str, evaluate: bool):
+        """
+        Прогнозирует продукты по очереди в текущем процессе
+        
+        Данные следующего продукта готовятся в фоновом потоке, пока модели
+        обучаются на текущем (statsmodels и BLAS отпускают GIL). Календарные
+        признаки во время прогноза добавляет только этот поток.
+        
+        Args:
+            products: Список кодов продуктов
+            sales_groups: Словарь {unified_code: продажи продукта}
+            last_dates: Словарь {unified_code: последняя дата продаж}
+            future_templates: Словарь {последняя дата: будущие даты с признаками}
+            marketplace: 'wb' или 'ozon'
+            evaluate: Оценивать ли модели
+        
+        Yields:
+            Пары (unified_code, словарь прогнозов) в порядке продуктов
+        """
+        def prepare(product):
+            return _prepare_product(product, sales_groups[product],
+                                    future_templates[last_dates[product]],
+                                    self.calendar_features, marketplace)
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(prepare, products[0]) if products else None
+            for i, product in enumerate(products):
+                product_data, future_df = pending.result()
+                if i + 1 < len(products):
+                    pending = executor.submit(prepare, products[i + 1])
+                
+                yield product, _forecast_prepared(product, product_data, future_df, self.models,
+                                                  self.evaluator, self.forecast_months, evaluate)
+    
+    def _forecast_products_parallel(self, products: List[str],
+                                    sales_groups: Dict[str, pd.DataFrame],
+                                    last_dates: Dict[str, pd.Timestamp],
+                                    future_templates: Dict[pd.Timestamp, pd.DataFrame],
+                                    marketplace: str, evaluate: bool,
+                                    n_jobs: int) -> List[Tuple[str, Dict]]:
+        """
+        Прогнозирует продукты параллельно в пуле процессов
+        
+        Каждый продукт - отдельная задача, в которую передаются только его
+        продажи и ключ шаблона будущих дат; общие данные получает
+        инициализатор процесса. Результаты оценки моделей из
+        процессов-исполнителей переносятся в self.evaluator.
+        
+        Процессы запускаются через spawn: ядра numba с parallel=True
+        (округление до коробов, прогноз бинарной регрессии) поднимают
+        пул потоков в родительском процессе, и после fork дочерние
+        процессы на нем зависают.
+        
+        Args:
+            products: Список кодов продуктов
+            sales_groups: Словарь {unified_code: продажи продукта}
+            last_dates: Словарь {unified_code: последняя дата продаж}
+            future_templates: Словарь {последняя дата: будущие даты с признаками}
+            marketplace: 'wb' или 'ozon'
+            evaluate: Оценивать ли модели
+            n_jobs: Количество процессов
+        
+        Returns:
+            Список пар (unified_code, словарь прогнозов) в порядке продуктов
+        """
+        product_results = []
+        initargs = (self.model_specs, self.calendar_features, future_templates,
+                    marketplace, self.forecast_months, evaluate)
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(products)),
+                                 mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=initargs) as executor:
+            futures = [
+                (product, executor.submit(
+                    _forecast_product_task, product, sales_groups[product], last_dates[product]
+                ))
+                for product in products
+            ]
+            
+            for product, future in futures:
+                try:
+                    forecasts, evaluation_results = future.result()
+                except Exception as e:
+                    print(f"    Ошибка прогнозирования для {product}: {e}")
+                    continue
+                
+                self.evaluator.add_results(evaluation_results)
+                product_results.append((product, forecasts))
+        
+        return product_results
+    
     def select_best_forecasts(self, forecasts: Dict[str, pd.DataFrame],
                              marketplace: str) -> pd.DataFrame:
         """
@@ -258,20 +638,25 @@ class SalesForecaster:
         
         best_forecasts = []
         
+        # Прогнозы каждой модели разбиваются по продуктам одним проходом groupby
+        per_product = {
+            model_name: dict(list(forecast_df.groupby('unified_code', sort=False, observed=True)))
+            for model_name, forecast_df in forecasts.items()
+        }
+        
         # Получаем все продукты
         all_products = set()
-        for forecast_df in forecasts.values():
-            all_products.update(forecast_df['unified_code'].unique())
+        for product_groups in per_product.values():
+            all_products.update(product_groups)
         
         for product in all_products:
             # Выбираем лучшую модель для продукта
             best_model = self.evaluator.select_best_model(product, metric='mape')
             
-            if best_model and best_model in forecasts:
-                product_forecast = forecasts[best_model][
-                    forecasts[best_model]['unified_code'] == product
-                ].copy()
-                product_forecast['selected_model'] = best_model
+            if best_model and product in per_product.get(best_model, {}):
+                product_forecast = per_product[best_model][product].assign(
+                    selected_model=best_model
+                )
                 best_forecasts.append(product_forecast)
         
         if not best_forecasts:
@@ -291,14 +676,20 @@ class SalesForecaster:
         """
         print("Применение ограничений к прогнозу...")
         
+        # Последние остатки считаем один раз для обоих ограничений
+        latest_stocks = {
+            name: self.constraints.get_latest_stocks(self.data.get(name, pd.DataFrame()))
+            for name in ('wb_stocks', 'ozon_stocks', 'our_stocks')
+        }
+        
         # Ограничения для продуктов на вывод
         if 'withdraw' in self.data and not self.data['withdraw'].empty:
             forecast = self.constraints.apply_withdraw_constraints(
                 forecast,
                 self.data['withdraw'],
-                self.data.get('wb_stocks', pd.DataFrame()),
-                self.data.get('ozon_stocks', pd.DataFrame()),
-                self.data.get('our_stocks', pd.DataFrame())
+                latest_stocks['wb_stocks'],
+                latest_stocks['ozon_stocks'],
+                latest_stocks['our_stocks']
             )
         
         # Ограничения для продуктов в дефектуре
@@ -306,8 +697,8 @@ class SalesForecaster:
             forecast = self.constraints.apply_defecture_constraints(
                 forecast,
                 self.data['defecture'],
-                self.data.get('wb_stocks', pd.DataFrame()),
-                self.data.get('ozon_stocks', pd.DataFrame())
+                latest_stocks['wb_stocks'],
+                latest_stocks['ozon_stocks']
             )
         
         return forecast
@@ -332,18 +723,9 @@ class SalesForecaster:
             return pd.DataFrame()
         
         # Агрегируем прогноз по месяцам для расчета отгрузок
-        forecast_for_shipment = forecast.copy()
+        forecast_for_shipment = forecast
         if 'date' in forecast_for_shipment.columns:
-            forecast_for_shipment['date'] = pd.to_datetime(forecast_for_shipment['date'])
-            # Создаем месячную агрегацию
-            forecast_for_shipment['year_month'] = forecast_for_shipment['date'].dt.to_period('M')
-            forecast_monthly = forecast_for_shipment.groupby(
-                ['year_month', 'unified_code']
-            ).agg({
-                'quantity': 'sum'
-            }).reset_index()
-            forecast_monthly['date'] = forecast_monthly['year_month'].dt.to_timestamp()
-            forecast_for_shipment = forecast_monthly[['date', 'unified_code', 'quantity']]
+            forecast_for_shipment = _monthly_sum(forecast_for_shipment)
         
         shipments = self.shipment_calculator.calculate_shipments(
             forecast_for_shipment, stocks, marketplace=marketplace
@@ -0,0 +1,32 @@
+"""
+Вспомогательные функции записи выходных файлов
+"""
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+def _write_csv_fast(df: pd.DataFrame, path):
+    """
+    Записывает DataFrame в CSV без индекса
+    
+    При наличии pyarrow строки форматируются многопоточно по колонкам
+    и пишутся в файл блоками, без сборки всего CSV в одну строку.
+    
+    Args:
+        df: DataFrame для записи
+        path: Путь к файлу
+    """
+    if PYARROW_AVAILABLE:
+        try:
+            pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), str(path))
+            return
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+            print(f"Ошибка при записи CSV через pyarrow, используется pandas: {e}")
+    
+    df.to_csv(path, index=False)
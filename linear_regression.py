@@ -3,17 +3,175 @@
 """
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from sklearn.feature_selection import SelectKBest, f_regression
-from sklearn.preprocessing import StandardScaler
+from collections import namedtuple
 from typing import Dict, Optional, List
 import warnings
 warnings.filterwarnings('ignore')
 
+from .fit_cache import FitCache, array_digest
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, cache=True)
+    def _binary_predict(x, mean, inv_std, coef, intercept, out):
+        """Прогноз линейной модели по бинарным признакам int8, отрицательные значения обнуляются"""
+        for i in prange(x.shape[0]):
+            acc = intercept
+            for j in range(x.shape[1]):
+                acc += coef[j] * (x[i, j] - mean[j]) * inv_std[j]
+            out[i] = max(acc, 0.0)
+
+
+def _make_predict_kernel(k: int):
+    """
+    Компилирует ядро прогноза линейной регрессии для фиксированного числа фичей
+    
+    k захватывается замыканием и для numba является константой, поэтому
+    внутренний цикл по фичам имеет известную длину и разворачивается
+    компилятором. На вход подается матрица только отобранных фичей,
+    масштабирование выполняется в float32, как в прогнозе через NumPy.
+    """
+    @njit
+    def kernel(x, mean, scale, coef, intercept, out):
+        for i in range(x.shape[0]):
+            acc = intercept
+            for j in range(k):
+                acc += coef[j] * ((x[i, j] - mean[j]) / scale[j])
+            out[i] = max(acc, 0.0)
+    
+    return kernel
+
+
+# Коэффициенты обученной линейной регрессии одного продукта
+LinearFit = namedtuple('LinearFit', ['coef', 'intercept'])
+
+# Колонки, которые не используются как признаки
+NON_FEATURE_COLUMNS = ['date', 'quantity', 'unified_code', 'sku', 'solo_code']
+
+# Количество продуктов в одной пачке совместного обучения
+# (ограничивает размер трехмерных массивов признаков)
+FIT_BATCH_SIZE = 256
+
+# Порог отсечения сингулярных чисел (относительно наибольшего), выбранный
+# отдельно: это не параметр LinearRegression. При меньшем пороге (например,
+# по умолчанию в pinv) коэффициенты вырожденных наборов бинарных признаков
+# определяются ошибками округления
+LSTSQ_RCOND = 1e-6
+
+def _to_matrix(df: pd.DataFrame, columns: List[str], dtype=np.float64) -> np.ndarray:
+    """Матрица значений колонок без пропусков (NaN заменяются нулями на месте)"""
+    return np.nan_to_num(df[columns].to_numpy(dtype=dtype, na_value=np.nan), copy=False)
+
+
+def _pad_batch(X_list: List[np.ndarray], y_list: List[np.ndarray]):
+    """
+    Складывает ряды разной длины в массивы (P, N, K) и (P, N) с нулями в конце
+    
+    Returns:
+        Кортеж (X, y, маска строк (P, N, 1), длины рядов (P,))
+    """
+    n = np.array([len(y) for y in y_list])
+    n_max = n.max()
+    X = np.zeros((len(X_list), n_max, X_list[0].shape[1]))
+    y = np.zeros((len(y_list), n_max))
+    for i, (X_i, y_i) in enumerate(zip(X_list, y_list)):
+        X[i, :len(y_i)] = X_i
+        y[i, :len(y_i)] = y_i
+    
+    row_mask = (np.arange(n_max) < n[:, None])[:, :, None]
+    return X, y, row_mask, n
+
+
+def _standardize_batch(X: np.ndarray, row_mask: np.ndarray, n: np.ndarray):
+    """
+    Z-преобразование признаков каждого ряда, как в StandardScaler
+    
+    Постоянные признаки не масштабируются (делитель 1).
+    
+    Returns:
+        Кортеж (масштабированный X с нулями в строках-заполнителях,
+                средние (P, K), делители (P, K))
+    """
+    eps = np.finfo(np.float64).eps
+    n_col = n[:, None]
+    mean = X.sum(axis=1) / n_col
+    centered = (X - mean[:, None, :]) * row_mask
+    var = np.einsum('pnk,pnk->pk', centered, centered) / n_col
+    
+    scale = np.sqrt(var)
+    constant = var <= n_col * eps * var + (n_col * mean * eps) ** 2
+    scale[constant | (scale < 10 * eps)] = 1.0
+    
+    return centered / scale[:, None, :], mean, scale
+
+
+def _f_scores_batch(X: np.ndarray, y: np.ndarray, row_mask: np.ndarray,
+                    n: np.ndarray) -> np.ndarray:
+    """
+    F-статистики признаков для каждого ряда, как в f_regression
+    
+    X должен быть результатом _standardize_batch: признаки уже центрированы
+    и имеют единичную дисперсию, поэтому норма столбца равна sqrt(n), а
+    постоянные признаки нулевые. Корреляции всех признаков с целевой
+    переменной считаются одной пакетной сверткой X.T @ y без отдельных
+    проходов по X для средних и норм.
+    
+    Returns:
+        Массив (P, K) F-статистик (бесконечные заменены на максимум float,
+        неопределенные - на 0)
+    """
+    n_col = n[:, None]
+    y_centered = (y - (y.sum(axis=1) / n)[:, None]) * row_mask[:, :, 0]
+    y_norms = np.sqrt(np.einsum('pn,pn->p', y_centered, y_centered))
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.einsum('pn,pnk->pk', y_centered, X) / (np.sqrt(n_col) * y_norms[:, None])
+        corr[np.isnan(corr)] = 0.0
+        corr_squared = corr ** 2
+        scores = corr_squared / (1 - corr_squared) * (n_col - 2)
+    
+    scores[np.isinf(scores)] = np.finfo(np.float64).max
+    scores[np.isnan(scores)] = 0.0
+    return scores
+
+
+def _lstsq_batch(X: np.ndarray, y: np.ndarray, row_mask: np.ndarray,
+                 n: np.ndarray):
+    """
+    Линейная регрессия с intercept для каждого ряда пачки
+    
+    Решение с минимальной нормой через пакетное SVD (np.linalg.pinv),
+    как lstsq в LinearRegression.
+    
+    Returns:
+        Кортеж (коэффициенты (P, K), intercept (P,))
+    """
+    n_col = n[:, None]
+    X_offset = X.sum(axis=1) / n_col
+    y_offset = y.sum(axis=1) / n
+    X_centered = (X - X_offset[:, None, :]) * row_mask
+    y_centered = (y - y_offset[:, None]) * row_mask[:, :, 0]
+    
+    coef = np.einsum('pkn,pn->pk', np.linalg.pinv(X_centered, rcond=LSTSQ_RCOND), y_centered)
+    intercept = y_offset - np.einsum('pk,pk->p', X_offset, coef)
+    return coef, intercept
+
 
 class LinearRegressionModel:
     """Линейная регрессия с подбором фичей"""
     
+    # Минимальное число наблюдений для обучения
+    min_obs = 2
+    
+    # Скомпилированные ядра прогноза {число фичей: ядро}, общие для всех экземпляров
+    _predict_kernels = {}
+    
     def __init__(self, use_feature_selection: bool = True, k_features: int = 10):
         """
         Инициализация
@@ -27,7 +185,19 @@ class LinearRegressionModel:
         self.models = {}
         self.scalers = {}
         self.selected_features = {}
+        # Индексы выбранных фичей {unified_code: массив int64}
+        self._feature_index = {}
         self.feature_names = []
+        self._fit_cache = FitCache()
+    
+    @classmethod
+    def _get_predict_kernel(cls, k: int):
+        """Возвращает ядро прогноза для k фичей, компилируя его при первом запросе"""
+        kernel = cls._predict_kernels.get(k)
+        if kernel is None:
+            kernel = _make_predict_kernel(k)
+            cls._predict_kernels[k] = kernel
+        return kernel
     
     def fit(self, data: pd.DataFrame, unified_code: str, 
             feature_columns: List[str] = None):
@@ -45,43 +215,127 @@ class LinearRegressionModel:
         
         if feature_columns is None:
             # Автоматический выбор признаков
-            feature_columns = [col for col in data.columns 
-                            if col not in ['date', 'quantity', 'unified_code', 'sku', 'solo_code']]
+            feature_columns = [col for col in data.columns if col not in NON_FEATURE_COLUMNS]
         
         if not feature_columns:
             self.models[unified_code] = None
             return
         
-        X = data[feature_columns].fillna(0)
-        y = data['quantity'].fillna(0)
+        X = _to_matrix(data, feature_columns)
+        y = _to_matrix(data, ['quantity'])[:, 0]
         
-        if len(X) < 2:
+        if len(X) < self.min_obs:
             self.models[unified_code] = None
             return
         
-        # Масштабирование
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        self.scalers[unified_code] = scaler
-        
-        # Подбор фичей
-        if self.use_feature_selection and len(feature_columns) > self.k_features:
-            selector = SelectKBest(f_regression, k=min(self.k_features, len(feature_columns)))
-            X_selected = selector.fit_transform(X_scaled, y)
-            self.selected_features[unified_code] = selector.get_support()
-            selected_feature_names = [feature_columns[i] for i in range(len(feature_columns)) 
-                                    if self.selected_features[unified_code][i]]
-        else:
-            X_selected = X_scaled
-            self.selected_features[unified_code] = np.ones(len(feature_columns), dtype=bool)
-            selected_feature_names = feature_columns
+        self._fit_batch([unified_code], [X], [y], feature_columns)
+    
+    def fit_many(self, data: pd.DataFrame, product_col: str = 'unified_code',
+                 feature_columns: List[str] = None):
+        """
+        Обучение модели сразу для всех продуктов
+        
+        Масштабирование, подбор фичей и решение МНК выполняются
+        пакетными операциями NumPy над пачками продуктов вместо
+        отдельного вызова sklearn на каждый продукт.
+        
+        Args:
+            data: DataFrame с признаками, целевой переменной 'quantity'
+                  и колонкой кода продукта
+            product_col: Колонка с кодом продукта
+            feature_columns: Список колонок-признаков
+        """
+        if data.empty or 'quantity' not in data.columns or product_col not in data.columns:
+            return
+        
+        groups = data.groupby(product_col, sort=False, observed=True).indices
+        
+        if feature_columns is None:
+            feature_columns = [col for col in data.columns
+                               if col not in NON_FEATURE_COLUMNS and col != product_col]
+        
+        if not feature_columns:
+            for unified_code in groups:
+                self.models[unified_code] = None
+            return
+        
+        X_all = _to_matrix(data, feature_columns)
+        y_all = _to_matrix(data, ['quantity'])[:, 0]
         
-        self.feature_names = selected_feature_names
+        codes, X_list, y_list = [], [], []
+        for unified_code, positions in groups.items():
+            if len(positions) < self.min_obs:
+                self.models[unified_code] = None
+                continue
+            codes.append(unified_code)
+            X_list.append(X_all[positions])
+            y_list.append(y_all[positions])
         
-        # Обучение модели
-        model = LinearRegression()
-        model.fit(X_selected, y)
-        self.models[unified_code] = model
+        if codes:
+            self._fit_batch(codes, X_list, y_list, feature_columns)
+    
+    def _fit_batch(self, codes: List[str], X_list: List[np.ndarray],
+                   y_list: List[np.ndarray], feature_columns: List[str]):
+        """
+        Обучает модели для списка продуктов пачками по FIT_BATCH_SIZE
+        
+        Продукты, уже обученные на тех же данных, берутся из кэша.
+        
+        Args:
+            codes: Коды продуктов
+            X_list: Матрицы признаков продуктов (одинаковые колонки)
+            y_list: Целевые переменные продуктов
+            feature_columns: Названия колонок-признаков
+        """
+        n_features = len(feature_columns)
+        k = min(self.k_features, n_features)
+        use_selection = self.use_feature_selection and n_features > self.k_features
+        config = (tuple(feature_columns), self.use_feature_selection, self.k_features)
+        
+        keys = [
+            (unified_code, array_digest(X, y), config)
+            for unified_code, X, y in zip(codes, X_list, y_list)
+        ]
+        states = {i: self._fit_cache.get(key) for i, key in enumerate(keys)}
+        misses = [i for i, state in states.items() if state is None]
+        
+        for start in range(0, len(misses), FIT_BATCH_SIZE):
+            batch = misses[start:start + FIT_BATCH_SIZE]
+            X, y, row_mask, n = _pad_batch([X_list[i] for i in batch],
+                                           [y_list[i] for i in batch])
+            
+            # Масштабирование
+            X_scaled, mean, scale = _standardize_batch(X, row_mask, n)
+            
+            # Подбор фичей: k лучших по F-статистике, порядок колонок сохраняется
+            if use_selection:
+                scores = _f_scores_batch(X_scaled, y, row_mask, n)
+                top = np.sort(np.argsort(scores, axis=1, kind='mergesort')[:, -k:], axis=1)
+                X_selected = np.take_along_axis(X_scaled, top[:, None, :], axis=2)
+            else:
+                top = np.broadcast_to(np.arange(n_features), (len(n), n_features))
+                X_selected = X_scaled
+            
+            # Обучение модели
+            coef, intercept = _lstsq_batch(X_selected, y, row_mask, n)
+            
+            for j, i in enumerate(batch):
+                selected = np.zeros(n_features, dtype=bool)
+                selected[top[j]] = True
+                # Параметры масштабирования хранятся в float32: прогноз
+                # читает вдвое меньше байт
+                scaler = (mean[j].astype(np.float32), scale[j].astype(np.float32))
+                states[i] = (scaler, selected, LinearFit(coef[j], intercept[j]),
+                             [feature_columns[c] for c in top[j]])
+                self._fit_cache.put(keys[i], states[i])
+        
+        for i, unified_code in enumerate(codes):
+            scaler, selected, fitted, feature_names = states[i]
+            self.scalers[unified_code] = scaler
+            self.selected_features[unified_code] = selected
+            self._feature_index[unified_code] = np.flatnonzero(selected)
+            self.models[unified_code] = fitted
+            self.feature_names = feature_names
     
     def predict(self, unified_code: str, future_features: pd.DataFrame, 
                 periods: int = 18) -> np.ndarray:
@@ -109,22 +363,31 @@ class LinearRegressionModel:
         if not feature_columns:
             return np.zeros(periods)
         
-        X = future_features[feature_columns].fillna(0)
-        
-        # Масштабирование
-        X_scaled = self.scalers[unified_code].transform(X)
-        
-        # Выбор фичей
-        if unified_code in self.selected_features:
-            X_selected = X_scaled[:, self.selected_features[unified_code]]
-        else:
-            X_selected = X_scaled
-        
-        # Прогноз
-        predictions = self.models[unified_code].predict(X_selected)
-        predictions = np.maximum(predictions, 0)  # Отрицательные значения не имеют смысла
-        
-        return predictions[:periods]
+        mean, scale = self.scalers[unified_code]
+        fitted = self.models[unified_code]
+        if len(feature_columns) != len(mean):
+            raise ValueError(f"Ожидалось {len(mean)} признаков, получено {len(feature_columns)}")
+        
+        # В матрицу попадают только отобранные фичи и только первые periods
+        # строк (строки прогноза независимы), сразу в float32
+        feature_index = self._feature_index[unified_code]
+        selected_columns = [feature_columns[i] for i in feature_index]
+        X = _to_matrix(future_features.iloc[:periods], selected_columns, np.float32)
+        mean = mean[feature_index]
+        scale = scale[feature_index]
+        
+        # Прогноз (отрицательные значения не имеют смысла)
+        if NUMBA_AVAILABLE:
+            predictions = np.empty(len(X))
+            kernel = self._get_predict_kernel(len(feature_index))
+            kernel(X, mean, scale, fitted.coef, fitted.intercept, predictions)
+            return predictions
+        
+        # Масштабирование одним выражением NumPy в float32
+        X_scaled = (X - mean) / scale
+        
+        predictions = X_scaled @ fitted.coef + fitted.intercept
+        return np.maximum(predictions, 0)
     
     def get_model_name(self) -> str:
         """Возвращает название модели"""
@@ -134,11 +397,17 @@ class LinearRegressionModel:
 class BinaryLinearRegressionModel:
     """Линейная регрессия с бинарными признаками"""
     
+    # Минимальное число наблюдений для обучения
+    min_obs = 2
+    
     def __init__(self):
         """Инициализация"""
         self.models = {}
         self.scalers = {}
         self.feature_names = []
+        # Позиции признаков обучения {признак: номер колонки}
+        self._feature_index = {}
+        self._fit_cache = FitCache()
     
     def fit(self, data: pd.DataFrame, unified_code: str):
         """
@@ -162,23 +431,32 @@ class BinaryLinearRegressionModel:
             self.models[unified_code] = None
             return
         
-        X = data[binary_features].fillna(0)
-        y = data['quantity'].fillna(0)
+        X = _to_matrix(data, binary_features)
+        y = _to_matrix(data, ['quantity'])[:, 0]
         
-        if len(X) < 2:
+        if len(X) < self.min_obs:
             self.models[unified_code] = None
             return
         
-        # Масштабирование
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        self.scalers[unified_code] = scaler
-        self.feature_names = binary_features
-        
-        # Обучение модели
-        model = LinearRegression()
-        model.fit(X_scaled, y)
-        self.models[unified_code] = model
+        key = (unified_code, array_digest(X, y), tuple(binary_features))
+        state = self._fit_cache.get(key)
+        if state is None:
+            # Масштабирование и МНК - те же функции NumPy, что и в
+            # LinearRegressionModel, для пачки из одного ряда
+            X_batch, y_batch, row_mask, n = _pad_batch([X], [y])
+            X_scaled, mean, scale = _standardize_batch(X_batch, row_mask, n)
+            coef, intercept = _lstsq_batch(X_scaled, y_batch, row_mask, n)
+            
+            # Для прогноза хранятся только массивы: среднее, обратный
+            # масштаб (деление заменяется умножением) и коэффициенты
+            state = ((mean[0], 1.0 / scale[0]),
+                     LinearFit(coef[0], float(intercept[0])))
+            self._fit_cache.put(key, state)
+        
+        self.scalers[unified_code], self.models[unified_code] = state
+        if binary_features != self.feature_names:
+            self.feature_names = binary_features
+            self._feature_index = {f: i for i, f in enumerate(binary_features)}
     
     def predict(self, unified_code: str, future_features: pd.DataFrame, 
                 periods: int = 18) -> np.ndarray:
@@ -209,28 +487,31 @@ class BinaryLinearRegressionModel:
             return np.zeros(periods)
         
         # Используем только те признаки, которые были в обучении
-        available_features = [f for f in self.feature_names if f in binary_features]
+        available_features = [f for f in binary_features if f in self._feature_index]
         
         if not available_features:
             return np.zeros(periods)
         
-        X = future_features[available_features].fillna(0)
-        
-        # Добавляем недостающие признаки нулями
-        missing_features = [f for f in self.feature_names if f not in available_features]
-        for feature in missing_features:
-            X[feature] = 0
-        
-        X = X[self.feature_names]
-        
-        # Масштабирование
-        X_scaled = self.scalers[unified_code].transform(X)
-        
-        # Прогноз
-        predictions = self.models[unified_code].predict(X_scaled)
-        predictions = np.maximum(predictions, 0)  # Отрицательные значения не имеют смысла
+        # Матрица в порядке признаков обучения (бинарные признаки занимают
+        # один байт): имеющиеся колонки записываются на свои позиции,
+        # недостающие остаются нулями. Строки прогноза независимы,
+        # поэтому берутся только первые periods
+        future_features = future_features.iloc[:periods]
+        X = np.zeros((len(future_features), len(self.feature_names)), dtype=np.int8)
+        X[:, [self._feature_index[f] for f in available_features]] = (
+            _to_matrix(future_features, available_features)
+        )
+        mean, inv_std = self.scalers[unified_code]
+        fitted = self.models[unified_code]
+        
+        # Прогноз (отрицательные значения не имеют смысла)
+        if NUMBA_AVAILABLE:
+            predictions = np.empty(len(X))
+            _binary_predict(X, mean, inv_std, fitted.coef, fitted.intercept, predictions)
+        else:
+            predictions = np.maximum(((X - mean) * inv_std) @ fitted.coef + fitted.intercept, 0)
         
-        return predictions[:periods]
+        return predictions
     
     def get_model_name(self) -> str:
         """Возвращает название модели"""
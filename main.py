@@ -18,13 +18,16 @@ def main():
                        help='Количество месяцев для прогноза')
     parser.add_argument('--product', type=str, default=None,
                        help='Унифицированный код продукта (если None - для всех)')
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                       help='Количество процессов для прогнозирования (-1 - все ядра)')
     
     args = parser.parse_args()
     
     # Создаем прогнозировщик
     forecaster = SalesForecaster(
         data_path=args.data_path,
-        forecast_months=args.months
+        forecast_months=args.months,
+        n_jobs=args.n_jobs
     )
     
     # Загружаем данные
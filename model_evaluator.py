@@ -3,18 +3,277 @@
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple
-from sklearn.metrics import mean_absolute_error, mean_squared_error, mean_absolute_percentage_error
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    from joblib import Parallel, delayed
+    JOBLIB_AVAILABLE = True
+except ImportError:
+    JOBLIB_AVAILABLE = False
+
+try:
+    import bottleneck as bn
+    BOTTLENECK_AVAILABLE = True
+except ImportError:
+    BOTTLENECK_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+    # Без флагов nnan/ninf: проверки isfinite должны сохраниться,
+    # без arcp: деление не заменяется умножением на обратное
+    @njit(fastmath={'reassoc', 'contract', 'nsz'}, cache=True)
+    def _metrics_sums_kernel(y_true, y_pred, out):
+        """
+        Суммы для метрик по строкам за два прохода без временных массивов
+        
+        Значения читаются в float32 и накапливаются в float64.
+        """
+        for r in range(y_true.shape[0]):
+            count = 0
+            sum_abs = 0.0
+            sum_sq = 0.0
+            sum_ape = 0.0
+            sum_true = 0.0
+            for i in range(y_true.shape[1]):
+                t = np.float64(y_true[r, i])
+                p = np.float64(y_pred[r, i])
+                if t > 0 and np.isfinite(t) and np.isfinite(p):
+                    d = t - p
+                    sum_abs += abs(d)
+                    sum_sq += d * d
+                    sum_ape += abs(d) / t
+                    sum_true += t
+                    count += 1
+            
+            # Сумма квадратов отклонений факта от среднего вторым проходом:
+            # формула через сумму квадратов теряет точность и не дает
+            # точного нуля для постоянного ряда
+            ss_tot = 0.0
+            if count > 0:
+                mean_true = sum_true / count
+                for i in range(y_true.shape[1]):
+                    t = np.float64(y_true[r, i])
+                    if t > 0 and np.isfinite(t) and np.isfinite(y_pred[r, i]):
+                        c = t - mean_true
+                        ss_tot += c * c
+            
+            out[0, r] = count
+            out[1, r] = sum_abs
+            out[2, r] = sum_sq
+            out[3, r] = sum_ape
+            out[4, r] = ss_tot
+
+
+def _is_clean(y_true: np.ndarray, y_pred: np.ndarray) -> bool:
+    """
+    Проверяет, что все значения конечны, а факт положителен
+    
+    Проверка идет редукциями без временных булевых массивов: anynan
+    из bottleneck прерывается на первом NaN, а min/max распространяют
+    NaN и ловят бесконечности.
+    """
+    if y_true.size == 0:
+        return False
+    
+    if BOTTLENECK_AVAILABLE and (bn.anynan(y_true) or bn.anynan(y_pred)):
+        return False
+    
+    return bool(y_true.min() > 0 and y_true.max() < np.inf and
+                np.isfinite(y_pred.min()) and np.isfinite(y_pred.max()))
+
+
+def _metrics_sums(y_true: np.ndarray, y_pred: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Суммы по строкам, из которых складываются метрики
+    
+    Учитываются только точки с конечными значениями и положительным фактом.
+    
+    Returns:
+        Кортеж массивов длины N: (число точек, сумма |e|, сумма e^2,
+        сумма |e|/факт, сумма квадратов отклонений факта от среднего)
+    """
+    if NUMBA_AVAILABLE:
+        out = np.empty((5, y_true.shape[0]))
+        _metrics_sums_kernel(y_true, y_pred, out)
+        return (out[0].astype(np.int64),) + tuple(out[1:])
+    
+    if _is_clean(y_true, y_pred):
+        # Чистые данные: все точки учитываются, маска не нужна
+        diff = y_true - y_pred
+        abs_diff = np.abs(diff)
+        centered = y_true - y_true.mean(axis=1, dtype=np.float64)[:, None]
+        
+        return (np.full(y_true.shape[0], y_true.shape[1], dtype=np.int64),
+                abs_diff.sum(axis=1, dtype=np.float64),
+                (diff * diff).sum(axis=1, dtype=np.float64),
+                (abs_diff / y_true).sum(axis=1, dtype=np.float64),
+                (centered * centered).sum(axis=1))
+    
+    # Убираем нули и бесконечности
+    mask = np.isfinite(y_true) & np.isfinite(y_pred) & (y_true > 0)
+    n_obs = mask.sum(axis=1)
+    
+    # Исключенные точки обнуляются, поэтому суммы по строкам их не учитывают
+    diff = np.where(mask, y_true - y_pred, 0.0)
+    abs_diff = np.abs(diff)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_true = np.where(mask, y_true, 0.0).sum(axis=1, dtype=np.float64) / n_obs
+    centered = np.where(mask, y_true - mean_true[:, None], 0.0)
+    
+    return (n_obs,
+            abs_diff.sum(axis=1, dtype=np.float64),
+            (diff * diff).sum(axis=1, dtype=np.float64),
+            (abs_diff / np.where(mask, y_true, 1.0)).sum(axis=1, dtype=np.float64),
+            (centered * centered).sum(axis=1))
+
+
+# Метрики, для которых лучшая модель продукта поддерживается при вставке
+_METRICS = ('mae', 'rmse', 'mape', 'r2')
+
+# Колонки хранилища результатов (и сводки) в порядке вывода
+_RESULT_COLUMNS = _METRICS + ('model_name', 'unified_code')
+
+
+def _is_better(value: float, best_value: float, metric: str) -> bool:
+    """Строго ли значение метрики лучше текущего лучшего (равные не вытесняют первое)"""
+    if metric in ['mae', 'rmse', 'mape']:
+        return value < best_value
+    return value > best_value
+
+
+def _best_row(values: Optional[List[float]], rows: List[int], metric: str) -> int:
+    """
+    Выбирает строку с лучшим значением метрики
+    
+    Args:
+        values: Колонка значений метрики (None - метрика неизвестна)
+        rows: Строки результатов одного продукта
+        metric: Метрика для выбора ('mae', 'rmse', 'mape', 'r2')
+    
+    Returns:
+        Строка лучшей модели (первая из равных)
+    """
+    if values is None:
+        return rows[0]
+    if metric in ['mae', 'rmse', 'mape']:
+        # Меньше - лучше
+        return min(rows, key=values.__getitem__)
+    # r2: больше - лучше
+    return max(rows, key=values.__getitem__)
+
+
+def _cv_predict(data: pd.DataFrame, model, unified_code: str,
+                train_size: float) -> Tuple:
+    """
+    Обучает модель на начале ряда и прогнозирует оставшуюся часть
+    
+    Функция не зависит от оценщика, поэтому выполняется и в процессах joblib.
+    
+    Returns:
+        Кортеж (факт, прогноз, название модели, текст ошибки или None);
+        факт равен None, если оценка невозможна
+    """
+    if data.empty or len(data) < 10:
+        return None, None, None, None
+    
+    # Разделение на train/test
+    split_idx = int(len(data) * train_size)
+    train_data = data.iloc[:split_idx]
+    test_data = data.iloc[split_idx:]
+    
+    if len(test_data) == 0 or not hasattr(model, 'predict'):
+        return None, None, None, None
+    
+    try:
+        # Обучение модели и прогноз на тестовых данных
+        model.fit(train_data, unified_code)
+        y_pred = model.predict(unified_code, periods=len(test_data))
+        return test_data['quantity'].values, y_pred, model.get_model_name(), None
+    except Exception as e:
+        return None, None, None, str(e)
+
 
 class ModelEvaluator:
     """Класс для оценки качества моделей прогнозирования"""
     
     def __init__(self):
         """Инициализация"""
-        self.evaluation_results = {}
+        # Результаты хранятся по колонкам {колонка: список значений}
+        # без словаря на каждую пару (продукт, модель)
+        self._columns = {column: [] for column in _RESULT_COLUMNS}
+        # Строка результата по ключу (unified_code, model_name): коды
+        # продуктов могут содержать подчеркивания
+        self._rows = {}
+        # Строки результатов по продуктам {unified_code: {model_name: строка}}
+        self._product_results = defaultdict(dict)
+        # Строка лучшего результата {(unified_code, метрика): строка}
+        self._best = {}
+    
+    @property
+    def evaluation_results(self) -> Dict:
+        """
+        Результаты в виде словаря {(unified_code, model_name): метрики}
+        
+        Словарь собирается из колонок при каждом обращении.
+        """
+        return {key: self._result(row) for key, row in self._rows.items()}
+    
+    def _result(self, row: int) -> Dict:
+        """Словарь метрик строки результатов"""
+        return {column: values[row] for column, values in self._columns.items()}
+    
+    def _store_result(self, unified_code: str, model_name: str, result: Dict):
+        """
+        Сохраняет результат оценки и обновляет лучшую модель продукта
+        
+        Новый результат сравнивается только с текущим лучшим по каждой
+        метрике. При перезаписи результата модели лучшая модель продукта
+        пересчитывается по его результатам.
+        """
+        key = (unified_code, model_name)
+        row = self._rows.get(key)
+        replaced = row is not None
+        if not replaced:
+            row = len(self._rows)
+            self._rows[key] = row
+            for values in self._columns.values():
+                values.append(None)
+        
+        for metric in _METRICS:
+            self._columns[metric][row] = result[metric]
+        self._columns['model_name'][row] = model_name
+        self._columns['unified_code'][row] = unified_code
+        
+        product_rows = self._product_results[unified_code]
+        product_rows[model_name] = row
+        
+        for metric in _METRICS:
+            values = self._columns[metric]
+            best = self._best.get((unified_code, metric))
+            if replaced or best is None:
+                self._best[(unified_code, metric)] = _best_row(values, list(product_rows.values()), metric)
+            elif _is_better(values[row], values[best], metric):
+                self._best[(unified_code, metric)] = row
+    
+    def add_results(self, results: Dict):
+        """
+        Добавляет результаты другого оценщика (например, из процесса-воркера)
+        
+        Args:
+            results: Словарь {(unified_code, model_name): метрики}
+        """
+        for (unified_code, model_name), result in results.items():
+            self._store_result(unified_code, model_name, result)
     
     def evaluate_model(self, y_true: np.ndarray, y_pred: np.ndarray, 
                       model_name: str, unified_code: str) -> Dict:
@@ -43,9 +302,9 @@ class ModelEvaluator:
         y_true = y_true[:min_len]
         y_pred = y_pred[:min_len]
         
-        # Убираем нули и бесконечности
-        mask = np.isfinite(y_true) & np.isfinite(y_pred) & (y_true > 0)
-        if mask.sum() == 0:
+        metrics = self.evaluate_many(np.asarray(y_true)[None, :], np.asarray(y_pred)[None, :],
+                                     [model_name], [unified_code])
+        if metrics['n_obs'][0] == 0:
             return {
                 'mae': np.inf,
                 'rmse': np.inf,
@@ -53,35 +312,65 @@ class ModelEvaluator:
                 'r2': -np.inf
             }
         
-        y_true_filtered = y_true[mask]
-        y_pred_filtered = y_pred[mask]
+        return self._result(self._rows[(unified_code, model_name)])
+    
+    def evaluate_many(self, y_true: np.ndarray, y_pred: np.ndarray,
+                      model_names: List[str], unified_codes: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Оценивает качество моделей сразу для многих рядов
         
-        # Метрики
-        mae = mean_absolute_error(y_true_filtered, y_pred_filtered)
-        rmse = np.sqrt(mean_squared_error(y_true_filtered, y_pred_filtered))
+        Метрики всех рядов считаются редукциями по строкам матриц (ядро
+        numba или NumPy) вместо отдельного вызова на каждую пару
+        (продукт, модель).
+        Учитываются только точки с конечными значениями и положительным
+        фактом, поэтому ряды разной длины можно дополнять NaN.
         
-        # MAPE с защитой от деления на ноль
-        mape = np.mean(np.abs((y_true_filtered - y_pred_filtered) / y_true_filtered)) * 100
+        Args:
+            y_true: Матрица реальных значений (N, T)
+            y_pred: Матрица прогнозных значений (N, T)
+            model_names: Названия моделей для строк
+            unified_codes: Унифицированные коды продуктов для строк
         
-        # R2 score
-        ss_res = np.sum((y_true_filtered - y_pred_filtered) ** 2)
-        ss_tot = np.sum((y_true_filtered - np.mean(y_true_filtered)) ** 2)
-        r2 = 1 - (ss_res / ss_tot) if ss_tot > 0 else -np.inf
+        Returns:
+            Словарь {метрика: массив длины N} с метриками 'mae', 'rmse',
+            'mape', 'r2' и числом учтенных точек 'n_obs'. Результаты строк
+            с учтенными точками сохраняются в evaluation_results
+        """
+        # Прогнозы продаж не требуют точности float64: float32 вдвое
+        # сокращает объем читаемой памяти, суммы накапливаются в float64
+        y_true = np.asarray(y_true, dtype=np.float32)
+        y_pred = np.asarray(y_pred, dtype=np.float32)
         
-        results = {
-            'mae': mae,
-            'rmse': rmse,
-            'mape': mape,
-            'r2': r2,
-            'model_name': model_name,
-            'unified_code': unified_code
-        }
+        n_obs, sum_abs, ss_res, sum_ape, ss_tot = _metrics_sums(y_true, y_pred)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mae = sum_abs / n_obs
+            rmse = np.sqrt(ss_res / n_obs)
+            
+            # MAPE (нули исключены маской)
+            mape = sum_ape / n_obs * 100
+            
+            # R2 score
+            r2 = np.where(ss_tot > 0, 1 - ss_res / ss_tot, -np.inf)
+        
+        empty = n_obs == 0
+        mae[empty] = np.inf
+        rmse[empty] = np.inf
+        mape[empty] = np.inf
+        r2[empty] = -np.inf
         
         # Сохраняем результаты
-        key = f"{unified_code}_{model_name}"
-        self.evaluation_results[key] = results
+        for i in np.flatnonzero(~empty):
+            self._store_result(unified_codes[i], model_names[i], {
+                'mae': mae[i],
+                'rmse': rmse[i],
+                'mape': mape[i],
+                'r2': r2[i],
+                'model_name': model_names[i],
+                'unified_code': unified_codes[i]
+            })
         
-        return results
+        return {'mae': mae, 'rmse': rmse, 'mape': mape, 'r2': r2, 'n_obs': n_obs}
     
     def cross_validate(self, data: pd.DataFrame, model, unified_code: str,
                       train_size: float = 0.8) -> Dict:
@@ -97,20 +386,48 @@ class ModelEvaluator:
         Returns:
             Словарь с метриками
         """
-        if data.empty or len(data) < 10:
-            return {
-                'mae': np.inf,
-                'rmse': np.inf,
-                'mape': np.inf,
-                'r2': -np.inf
-            }
+        return self._cv_metrics(unified_code, _cv_predict(data, model, unified_code, train_size))
+    
+    def cross_validate_many(self, data_by_code: Dict[str, pd.DataFrame],
+                            model_factory: Callable, train_size: float = 0.8,
+                            n_jobs: int = -1) -> Dict[str, Dict]:
+        """
+        Параллельная кросс-валидация модели для нескольких продуктов
         
-        # Разделение на train/test
-        split_idx = int(len(data) * train_size)
-        train_data = data.iloc[:split_idx].copy()
-        test_data = data.iloc[split_idx:].copy()
+        Обучение и прогноз по продуктам независимы и выполняются в
+        процессах joblib, а метрики считаются и сохраняются в
+        evaluation_results после параллельной части.
+        
+        Args:
+            data_by_code: Словарь {unified_code: исторические данные}
+            model_factory: Функция без аргументов, создающая новую модель
+            train_size: Доля данных для обучения
+            n_jobs: Количество процессов (-1 - все ядра)
+        
+        Returns:
+            Словарь {unified_code: словарь с метриками}
+        """
+        items = list(data_by_code.items())
+        if JOBLIB_AVAILABLE:
+            outputs = Parallel(n_jobs=n_jobs, backend='loky')(
+                delayed(_cv_predict)(data, model_factory(), unified_code, train_size)
+                for unified_code, data in items
+            )
+        else:
+            outputs = [_cv_predict(data, model_factory(), unified_code, train_size)
+                       for unified_code, data in items]
         
-        if len(test_data) == 0:
+        return {
+            unified_code: self._cv_metrics(unified_code, output)
+            for (unified_code, _), output in zip(items, outputs)
+        }
+    
+    def _cv_metrics(self, unified_code: str, output: Tuple) -> Dict:
+        """Метрики кросс-валидации по результату _cv_predict"""
+        y_true, y_pred, model_name, error = output
+        if error is not None:
+            print(f"Ошибка кросс-валидации для {unified_code}: {error}")
+        if y_true is None:
             return {
                 'mae': np.inf,
                 'rmse': np.inf,
@@ -118,32 +435,9 @@ class ModelEvaluator:
                 'r2': -np.inf
             }
         
-        # Обучение модели
         try:
-            model.fit(train_data, unified_code)
-            
-            # Прогноз на тестовых данных
-            if hasattr(model, 'predict'):
-                # Для моделей, требующих будущие признаки
-                if hasattr(model, 'predict') and len(test_data) > 0:
-                    # Создаем будущие признаки (если нужны)
-                    periods = len(test_data)
-                    y_pred = model.predict(unified_code, periods=periods)
-                else:
-                    y_pred = model.predict(unified_code, periods=len(test_data))
-            else:
-                return {
-                    'mae': np.inf,
-                    'rmse': np.inf,
-                    'mape': np.inf,
-                    'r2': -np.inf
-                }
-            
-            y_true = test_data['quantity'].values
-            
             # Оценка
-            return self.evaluate_model(y_true, y_pred, model.get_model_name(), unified_code)
-            
+            return self.evaluate_model(y_true, y_pred, model_name, unified_code)
         except Exception as e:
             print(f"Ошибка кросс-валидации для {unified_code}: {e}")
             return {
@@ -164,26 +458,14 @@ class ModelEvaluator:
         Returns:
             Название лучшей модели
         """
-        # Фильтруем результаты по продукту
-        product_results = {
-            k: v for k, v in self.evaluation_results.items()
-            if k.startswith(f"{unified_code}_")
-        }
-        
-        if not product_results:
-            return None
-        
-        # Выбираем лучшую модель
-        if metric in ['mae', 'rmse', 'mape']:
-            # Меньше - лучше
-            best_key = min(product_results.keys(), 
-                          key=lambda k: product_results[k].get(metric, np.inf))
-        else:  # r2
-            # Больше - лучше
-            best_key = max(product_results.keys(),
-                          key=lambda k: product_results[k].get(metric, -np.inf))
+        if metric in _METRICS:
+            best = self._best.get((unified_code, metric))
+        else:
+            product_rows = self._product_results.get(unified_code)
+            best = (_best_row(self._columns.get(metric), list(product_rows.values()), metric)
+                    if product_rows else None)
         
-        return product_results[best_key]['model_name']
+        return self._columns['model_name'][best] if best is not None else None
     
     def get_evaluation_summary(self) -> pd.DataFrame:
         """
@@ -192,14 +474,11 @@ class ModelEvaluator:
         Returns:
             DataFrame с результатами оценки
         """
-        if not self.evaluation_results:
+        if not self._rows:
             return pd.DataFrame()
         
-        results_list = []
-        for key, results in self.evaluation_results.items():
-            results_list.append(results)
-        
-        return pd.DataFrame(results_list)
+        # Колонки хранилища передаются в DataFrame напрямую
+        return pd.DataFrame(self._columns)
     
     def get_best_models_summary(self) -> pd.DataFrame:
         """
@@ -208,26 +487,17 @@ class ModelEvaluator:
         Returns:
             DataFrame с лучшими моделями
         """
-        if not self.evaluation_results:
+        if not self._rows:
             return pd.DataFrame()
         
-        # Группируем по продуктам
-        products = set()
-        for key in self.evaluation_results.keys():
-            unified_code = key.split('_')[0]
-            products.add(unified_code)
-        
-        best_models = []
-        for product in products:
-            best_model = self.select_best_model(product)
-            if best_model:
-                # Находим метрики лучшей модели
-                key = f"{product}_{best_model}"
-                if key in self.evaluation_results:
-                    metrics = self.evaluation_results[key].copy()
-                    metrics['best_model'] = best_model
-                    best_models.append(metrics)
-        
-        return pd.DataFrame(best_models)
+        # Лучшие модели по продуктам поддерживаются при сохранении результатов
+        rows = [self._best[(unified_code, 'mape')] for unified_code in self._product_results]
+        best_models = pd.DataFrame({
+            column: [values[row] for row in rows]
+            for column, values in self._columns.items()
+        })
+        best_models['best_model'] = best_models['model_name']
+        
+        return best_models
 
 
@@ -4,6 +4,7 @@ Prophet модель прогнозирования
 import pandas as pd
 import numpy as np
 from typing import Dict, Optional
+from collections import OrderedDict
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -14,10 +15,30 @@ except ImportError:
     PROPHET_AVAILABLE = False
     print("Warning: prophet не установлен. Prophet модель недоступна.")
 
+from .fit_cache import FitCache, array_digest
+
+# Размер кэша обученных моделей Prophet (модели тяжелые, храним немного)
+PROPHET_CACHE_SIZE = 64
+
+# Сколько последних обученных моделей хранит экземпляр ProphetModel
+PROPHET_MAX_MODELS = 128
+
+# Ряды короче этого числа точек (и постоянные ряды) прогнозируются
+# средним без запуска Stan
+PROPHET_MIN_POINTS = 30
+
 
 class ProphetModel:
     """Prophet модель прогнозирования"""
     
+    # Минимальное число наблюдений для обучения
+    min_obs = 2
+    
+    # Обученные модели, общие для всех экземпляров. Ключ - хэш обучающего
+    # ряда и параметров модели, а не код продукта, поэтому одинаковые окна
+    # обучения (повторная кросс-валидация, повторный запуск) не переобучаются
+    _fit_cache = FitCache(PROPHET_CACHE_SIZE)
+    
     def __init__(self, yearly_seasonality: bool = True,
                  weekly_seasonality: bool = True,
                  daily_seasonality: bool = False,
@@ -38,7 +59,40 @@ class ProphetModel:
         self.weekly_seasonality = weekly_seasonality
         self.daily_seasonality = daily_seasonality
         self.holidays = holidays
-        self.models = {}
+        # Модели по кодам продуктов в порядке использования: хранятся
+        # только последние PROPHET_MAX_MODELS, иначе при тысячах продуктов
+        # память занимают объекты Stan и истории обучения
+        self.models = OrderedDict()
+        self._max_models = PROPHET_MAX_MODELS
+        self._params_key = self._make_params_key()
+    
+    def _make_params_key(self) -> tuple:
+        """Часть ключа кэша, описывающая параметры модели и праздники"""
+        holidays_digest = None
+        if self.holidays is not None:
+            names = '\n'.join(self.holidays['holiday'].astype(str)).encode()
+            holidays_digest = array_digest(
+                pd.to_datetime(self.holidays['ds']).to_numpy(dtype='datetime64[ns]'),
+                np.frombuffer(names, dtype=np.uint8)
+            )
+        return (self.yearly_seasonality, self.weekly_seasonality,
+                self.daily_seasonality, holidays_digest)
+    
+    def _store(self, unified_code: str, model):
+        """Сохраняет модель продукта, вытесняя самую старую при переполнении"""
+        self.models[unified_code] = model
+        self.models.move_to_end(unified_code)
+        if len(self.models) > self._max_models:
+            self.models.popitem(last=False)
+    
+    def evict(self, unified_code: str):
+        """
+        Освобождает модель продукта
+        
+        Args:
+            unified_code: Унифицированный код продукта
+        """
+        self.models.pop(unified_code, None)
     
     def fit(self, data: pd.DataFrame, unified_code: str):
         """
@@ -49,11 +103,17 @@ class ProphetModel:
             unified_code: Унифицированный код продукта
         """
         if data.empty or 'quantity' not in data.columns:
-            self.models[unified_code] = None
+            self._store(unified_code, None)
             return
         
-        if len(data) < 2:
-            self.models[unified_code] = None
+        if len(data) < self.min_obs:
+            self._store(unified_code, None)
+            return
+        
+        # Короткий или постоянный ряд: Prophet не обучается, прогноз - среднее
+        y = data['quantity'].fillna(0).to_numpy(dtype=np.float64)
+        if len(y) < PROPHET_MIN_POINTS or np.ptp(y) < 1e-9:
+            self._store(unified_code, ('const', float(y.mean())))
             return
         
         try:
@@ -63,20 +123,31 @@ class ProphetModel:
                 'y': data['quantity'].fillna(0).values
             })
             
-            # Создание модели
-            model = Prophet(
-                yearly_seasonality=self.yearly_seasonality,
-                weekly_seasonality=self.weekly_seasonality,
-                daily_seasonality=self.daily_seasonality,
-                holidays=self.holidays
-            )
+            key = (array_digest(prophet_data['ds'].to_numpy(dtype='datetime64[ns]'),
+                                 prophet_data['y'].to_numpy(dtype=np.float64)),
+                   self._params_key)
+            model = self._fit_cache.get(key)
+            if model is None:
+                # Создание модели. Нужен только yhat: без MCMC и без
+                # семплирования интервалов неопределенности в predict
+                model = Prophet(
+                    yearly_seasonality=self.yearly_seasonality,
+                    weekly_seasonality=self.weekly_seasonality,
+                    daily_seasonality=self.daily_seasonality,
+                    holidays=self.holidays,
+                    mcmc_samples=0,
+                    uncertainty_samples=0,
+                    stan_backend='CMDSTANPY'
+                )
+                
+                model.fit(prophet_data)
+                self._fit_cache.put(key, model)
             
-            model.fit(prophet_data)
-            self.models[unified_code] = model
+            self._store(unified_code, model)
             
         except Exception as e:
             print(f"Ошибка обучения Prophet для {unified_code}: {e}")
-            self.models[unified_code] = None
+            self._store(unified_code, None)
     
     def predict(self, unified_code: str, periods: int = 18, 
                 freq: str = 'D') -> np.ndarray:
@@ -94,6 +165,14 @@ class ProphetModel:
         if unified_code not in self.models or self.models[unified_code] is None:
             return np.zeros(periods)
         
+        model = self.models[unified_code]
+        if isinstance(model, tuple):
+            # Постоянный прогноз: дневное значение суммируется за 30 дней месяца
+            value = max(model[1], 0.0)
+            if freq == 'D' and periods > 0:
+                value *= 30
+            return np.full(periods, value, dtype=np.float32)
+        
         try:
             # Создание будущих дат
             if freq == 'D':
@@ -101,12 +180,12 @@ class ProphetModel:
             else:
                 future_periods = periods
             
-            future = self.models[unified_code].make_future_dataframe(
+            future = model.make_future_dataframe(
                 periods=future_periods, freq=freq
             )
             
             # Прогноз
-            forecast = self.models[unified_code].predict(future)
+            forecast = model.predict(future)
             
             # Берем только будущие значения
             predictions = forecast['yhat'].tail(future_periods).values
@@ -114,15 +193,16 @@ class ProphetModel:
             
             # Если нужны месячные значения, агрегируем
             if freq == 'D' and periods < future_periods:
-                # Агрегируем по месяцам
-                monthly_predictions = []
-                for i in range(periods):
-                    start_idx = i * 30
-                    end_idx = min((i + 1) * 30, len(predictions))
-                    monthly_predictions.append(predictions[start_idx:end_idx].sum())
-                return np.array(monthly_predictions)
+                # Агрегируем по месяцам: блоки по 30 дней суммируются
+                # одной операцией, недостающие дни дополняются нулями
+                if len(predictions) < future_periods:
+                    predictions = np.pad(predictions, (0, future_periods - len(predictions)))
+                predictions = predictions[:future_periods].reshape(periods, 30).sum(axis=1)
+            else:
+                predictions = predictions[:periods]
             
-            return predictions[:periods]
+            # Точности float32 достаточно для прогноза продаж
+            return predictions.astype(np.float32, copy=False)
             
         except Exception as e:
             print(f"Ошибка прогноза Prophet для {unified_code}: {e}")
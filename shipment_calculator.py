@@ -8,6 +8,28 @@ import warnings
 warnings.filterwarnings('ignore')
 
 
+def _categorize(df: pd.DataFrame, columns=('unified_code', 'warehouse')) -> pd.DataFrame:
+    """
+    Переводит строковые ключевые колонки в категории
+    
+    Группировки, слияния и сравнения по категориальной колонке идут по
+    целочисленным кодам, а не по строкам. Входной DataFrame не изменяется.
+    
+    Args:
+        df: DataFrame с ключевыми колонками
+        columns: Колонки для перевода
+    
+    Returns:
+        DataFrame с категориальными ключевыми колонками
+    """
+    converted = {
+        col: df[col].astype('category') for col in columns
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype)
+        and pd.api.types.is_string_dtype(df[col].dtype)
+    }
+    return df.assign(**converted) if converted else df
+
+
 class ShipmentCalculator:
     """Класс для расчета отгрузок"""
     
@@ -34,105 +56,101 @@ class ShipmentCalculator:
         Returns:
             DataFrame с расчетными отгрузками по складам
         """
-        shipments = []
+        forecast = _categorize(forecast)
+        stocks = _categorize(stocks)
         
         # Агрегируем прогноз по месяцам для расчета отгрузок
-        # (прогноз может быть по дням, но отгрузки обычно планируются помесячно)
-        forecast['year_month'] = forecast['date'].dt.to_period('M')
-        forecast_monthly = forecast.groupby(['year_month', 'unified_code'])['quantity'].sum().reset_index()
-        forecast_monthly['date'] = forecast_monthly['year_month'].dt.to_timestamp()
+        # (прогноз может быть по дням, но отгрузки обычно планируются помесячно).
+        # Месяц - приведение datetime64 к [M] вместо Period, входной
+        # DataFrame не изменяется
+        dates = forecast['date']
+        year_month = dates.to_numpy().astype('datetime64[M]')
+        forecast_monthly = (
+            forecast.assign(year_month=year_month)
+            .groupby(['year_month', 'unified_code'], observed=True, as_index=False)['quantity'].sum()
+        )
+        forecast_monthly['date'] = forecast_monthly['year_month'].astype(dates.dtype)
+        
+        # Коды остатков приводятся к категориям прогноза: слияние идет по
+        # совпадающим кодам, а продукты без прогноза отбрасываются группировкой
+        code_dtype = forecast_monthly['unified_code'].dtype
+        if ('unified_code' in stocks.columns and isinstance(code_dtype, pd.CategoricalDtype)
+                and stocks['unified_code'].dtype != code_dtype):
+            stocks = stocks.assign(unified_code=stocks['unified_code'].astype(code_dtype))
         
-        # Получаем последние остатки по складам
+        # Получаем последние остатки по складам: одна маска по колонке дат
+        # и только нужные для группировки колонки, без копии всей таблицы
+        stock_columns = ['unified_code', 'warehouse', 'stock']
         if not stocks.empty and 'date' in stocks.columns:
-            latest_date = stocks['date'].max()
-            latest_stocks = stocks[stocks['date'] == latest_date].copy()
+            dates = stocks['date']
+            latest_stocks = stocks.loc[(dates == dates.max()).to_numpy(), stock_columns]
         else:
-            latest_stocks = stocks.copy()
+            latest_stocks = stocks
         
         # Группируем остатки по продуктам и складам
         if not latest_stocks.empty:
             stocks_by_product_warehouse = latest_stocks.groupby(
-                ['unified_code', 'warehouse']
+                ['unified_code', 'warehouse'], observed=True
             )['stock'].sum().reset_index()
         else:
             stocks_by_product_warehouse = pd.DataFrame(columns=['unified_code', 'warehouse', 'stock'])
         
-        for _, row in forecast_monthly.iterrows():
-            date = row['date']
-            unified_code = row['unified_code']
-            forecasted_sales_monthly = row['quantity']
-            
-            # Получаем остатки по складам для этого продукта
-            product_stocks = stocks_by_product_warehouse[
-                stocks_by_product_warehouse['unified_code'] == unified_code
-            ].copy()
-            
-            if product_stocks.empty:
-                # Если нет остатков, пропускаем (или можно добавить логику распределения)
-                continue
-            
-            # Рассчитываем необходимый остаток на складе для месяца
-            # coverage_coefficient определяет, сколько нужно иметь на складе
-            required_stock_total = forecasted_sales_monthly * self.coverage_coefficient
-            
-            # Текущий остаток по всем складам
-            current_stock_total = product_stocks['stock'].sum()
-            
-            # Если общий остаток меньше требуемого, нужна отгрузка
-            if current_stock_total < required_stock_total:
-                total_shipment_needed = required_stock_total - current_stock_total
-                
-                # Распределяем отгрузку между складами пропорционально их текущим остаткам
-                # или равномерно, если остатков нет
-                if current_stock_total > 0:
-                    # Пропорциональное распределение
-                    product_stocks['shipment'] = (
-                        total_shipment_needed * product_stocks['stock'] / current_stock_total
-                    )
-                else:
-                    # Равномерное распределение
-                    n_warehouses = len(product_stocks)
-                    product_stocks['shipment'] = total_shipment_needed / n_warehouses
-                
-                # Добавляем информацию об отгрузках
-                for _, stock_row in product_stocks.iterrows():
-                    if stock_row['shipment'] > 0:
-                        shipments.append({
-                            'date': date,
-                            'warehouse': stock_row['warehouse'],
-                            'unified_code': unified_code,
-                            'forecasted_sales': forecasted_sales_monthly,
-                            'current_stock': stock_row['stock'],
-                            'required_stock': required_stock_total,
-                            'shipment': stock_row['shipment']
-                        })
-            else:
-                # Если остатков достаточно, но на каком-то складе может быть мало,
-                # можно добавить логику перераспределения
-                # Пока просто проверяем, что на каждом складе достаточно
-                for _, stock_row in product_stocks.iterrows():
-                    warehouse = stock_row['warehouse']
-                    current_stock = stock_row['stock']
-                    
-                    # Если на складе остаток меньше среднего требуемого на склад
-                    avg_required_per_warehouse = required_stock_total / len(product_stocks)
-                    if current_stock < avg_required_per_warehouse:
-                        shipment = avg_required_per_warehouse - current_stock
-                        shipments.append({
-                            'date': date,
-                            'warehouse': warehouse,
-                            'unified_code': unified_code,
-                            'forecasted_sales': forecasted_sales_monthly,
-                            'current_stock': current_stock,
-                            'required_stock': avg_required_per_warehouse,
-                            'shipment': shipment
-                        })
-        
-        if not shipments:
+        # Текущий остаток продукта по всем складам и число его складов
+        by_product = stocks_by_product_warehouse.groupby('unified_code', sort=False, observed=True)['stock']
+        stocks_by_product_warehouse = stocks_by_product_warehouse.assign(
+            stock_total=by_product.transform('sum'),
+            n_warehouses=by_product.transform('size')
+        )
+        
+        # Каждая строка месячного прогноза размножается по складам продукта
+        # (продукты без остатков пропускаются), порядок строк прогноза сохраняется
+        merged = forecast_monthly[['date', 'unified_code', 'quantity']].merge(
+            stocks_by_product_warehouse, on='unified_code', how='inner'
+        )
+        
+        stock = merged['stock'].to_numpy()
+        stock_total = merged['stock_total'].to_numpy()
+        n_warehouses = merged['n_warehouses'].to_numpy()
+        
+        # Рассчитываем необходимый остаток на складе для месяца
+        # coverage_coefficient определяет, сколько нужно иметь на складе
+        required_stock_total = merged['quantity'].to_numpy(dtype=np.float64) * self.coverage_coefficient
+        
+        # Если общий остаток меньше требуемого, нужна отгрузка
+        shortage = stock_total < required_stock_total
+        total_shipment_needed = required_stock_total - stock_total
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Распределяем отгрузку между складами пропорционально их текущим
+            # остаткам или равномерно, если остатков нет
+            shortage_shipment = np.where(
+                stock_total > 0,
+                total_shipment_needed * stock / stock_total,
+                total_shipment_needed / n_warehouses
+            )
+        
+        # Если остатков достаточно, проверяем, что на каждом складе
+        # не меньше среднего требуемого на склад
+        avg_required_per_warehouse = required_stock_total / n_warehouses
+        
+        shipment = np.where(shortage, shortage_shipment, avg_required_per_warehouse - stock)
+        required_stock = np.where(shortage, required_stock_total, avg_required_per_warehouse)
+        keep = np.where(shortage, shortage_shipment > 0, stock < avg_required_per_warehouse)
+        
+        if not keep.any():
             return pd.DataFrame(columns=['date', 'warehouse', 'unified_code', 'shipment'])
         
-        result = pd.DataFrame(shipments)
-        return result
+        # Колонки результата - срезы массивов по маске; ключевые колонки
+        # остаются категориальными (коды), без строковых объектов на строку
+        return pd.DataFrame({
+            'date': merged['date'].array[keep],
+            'warehouse': merged['warehouse'].array[keep],
+            'unified_code': merged['unified_code'].array[keep],
+            'forecasted_sales': merged['quantity'].to_numpy()[keep],
+            'current_stock': stock[keep],
+            'required_stock': required_stock[keep],
+            'shipment': shipment[keep]
+        })
     
     def analyze_shipment_calculation(self, historical_sales: pd.DataFrame,
                                    historical_stocks: pd.DataFrame,
@@ -153,34 +171,31 @@ class ShipmentCalculator:
         if historical_sales.empty or historical_stocks.empty:
             return analysis
         
+        historical_sales = _categorize(historical_sales)
+        historical_stocks = _categorize(historical_stocks)
+        if historical_shipments is not None:
+            historical_shipments = _categorize(historical_shipments)
+        
         # Анализ связи между продажами и остатками
-        # Группируем продажи по продуктам и датам
-        sales_grouped = historical_sales.groupby(['date', 'unified_code'])['quantity'].sum().reset_index()
+        # Группируем продажи по продуктам и датам. Результаты группировок
+        # остаются с индексом (date, unified_code) и соединяются по индексу
+        sales_grouped = historical_sales.groupby(['date', 'unified_code'], observed=True)['quantity'].sum()
+        
+        # Остатки по всем складам продукта на каждую дату
+        stocks_grouped = historical_stocks.groupby(['date', 'unified_code'], observed=True)['stock'].sum()
         
         # Анализируем для нескольких продуктов
-        products = sales_grouped['unified_code'].unique()[:10]  # Берем первые 10
+        sales_codes = sales_grouped.index.get_level_values('unified_code')
+        products = sales_codes.unique()[:10]  # Берем первые 10
         
-        coverage_ratios = []
+        # Общие даты продаж и остатков - внутреннее соединение по индексу,
+        # по каждому продукту берем первые 5 дат
+        merged = sales_grouped[sales_codes.isin(products)].to_frame().join(stocks_grouped, how='inner')
+        merged = merged.groupby(level='unified_code', observed=True, sort=False).head(5)
+        merged = merged[merged['quantity'] > 0]
+        coverage_ratios = (merged['stock'] / merged['quantity']).to_numpy()
         
-        for product in products:
-            product_sales = sales_grouped[sales_grouped['unified_code'] == product]
-            product_stocks = historical_stocks[historical_stocks['unified_code'] == product]
-            
-            if product_sales.empty or product_stocks.empty:
-                continue
-            
-            # Находим общие даты
-            common_dates = set(product_sales['date']) & set(product_stocks['date'])
-            
-            for date in list(common_dates)[:5]:  # Берем первые 5 дат
-                sales = product_sales[product_sales['date'] == date]['quantity'].sum()
-                stocks = product_stocks[product_stocks['date'] == date]['stock'].sum()
-                
-                if sales > 0:
-                    ratio = stocks / sales
-                    coverage_ratios.append(ratio)
-        
-        if coverage_ratios:
+        if len(coverage_ratios) > 0:
             analysis['avg_coverage_ratio'] = np.mean(coverage_ratios)
             analysis['median_coverage_ratio'] = np.median(coverage_ratios)
             analysis['min_coverage_ratio'] = np.min(coverage_ratios)
@@ -190,51 +205,42 @@ class ShipmentCalculator:
         if historical_shipments is not None and not historical_shipments.empty:
             # Анализ связи отгрузок с продажами и остатками
             # Группируем отгрузки по датам
-            shipments_grouped = historical_shipments.groupby(['date', 'unified_code'])['quantity'].sum().reset_index()
+            shipments_grouped = historical_shipments.groupby(['date', 'unified_code'], observed=True)['quantity'].sum()
+            
+            # Находим общие даты для анализа (первые 20)
+            sales_dates = sales_grouped.index.get_level_values('date')
+            common_dates = sales_dates.unique().intersection(
+                shipments_grouped.index.unique(level='date')
+            ).sort_values()[:20]
+            
+            # Общие продукты на эти даты - внутреннее соединение продаж и
+            # отгрузок по индексу, остатки присоединяются левым (их может не быть)
+            merged = (
+                sales_grouped[sales_dates.isin(common_dates)].to_frame()
+                .join(shipments_grouped.rename('shipments'), how='inner')
+                .join(stocks_grouped, how='left')
+            )
             
-            # Находим общие даты для анализа
-            common_dates = set(sales_grouped['date']) & set(shipments_grouped['date'])
+            sales = merged['quantity'].to_numpy(dtype=np.float64)
+            shipments = merged['shipments'].to_numpy(dtype=np.float64)
+            total_stock = merged['stock'].to_numpy(dtype=np.float64)
             
-            shipment_ratios = []
-            coverage_from_shipments = []
+            # Коэффициент отгрузки к продажам
+            has_sales = sales > 0
+            shipment_ratios = shipments[has_sales] / sales[has_sales]
             
-            for date in list(common_dates)[:20]:  # Берем первые 20 дат
-                date_sales = sales_grouped[sales_grouped['date'] == date]
-                date_shipments = shipments_grouped[shipments_grouped['date'] == date]
-                
-                # Находим общие продукты
-                common_products = set(date_sales['unified_code']) & set(date_shipments['unified_code'])
-                
-                for product in common_products:
-                    sales = date_sales[date_sales['unified_code'] == product]['quantity'].sum()
-                    shipments = date_shipments[date_shipments['unified_code'] == product]['quantity'].sum()
-                    
-                    if sales > 0:
-                        # Коэффициент отгрузки к продажам
-                        ratio = shipments / sales
-                        shipment_ratios.append(ratio)
-                    
-                    # Анализ покрытия через отгрузки
-                    # Если была отгрузка, значит был недостаток остатков
-                    if shipments > 0:
-                        # Получаем остатки на эту дату
-                        date_stocks = historical_stocks[
-                            (historical_stocks['date'] == date) & 
-                            (historical_stocks['unified_code'] == product)
-                        ]
-                        if not date_stocks.empty:
-                            total_stock = date_stocks['stock'].sum()
-                            if sales > 0:
-                                coverage = (total_stock + shipments) / sales
-                                coverage_from_shipments.append(coverage)
+            # Анализ покрытия через отгрузки
+            # Если была отгрузка, значит был недостаток остатков
+            covered = has_sales & (shipments > 0) & ~np.isnan(total_stock)
+            coverage_from_shipments = (total_stock[covered] + shipments[covered]) / sales[covered]
             
-            if shipment_ratios:
+            if len(shipment_ratios) > 0:
                 analysis['avg_shipment_ratio'] = np.mean(shipment_ratios)
                 analysis['median_shipment_ratio'] = np.median(shipment_ratios)
                 analysis['min_shipment_ratio'] = np.min(shipment_ratios)
                 analysis['max_shipment_ratio'] = np.max(shipment_ratios)
             
-            if coverage_from_shipments:
+            if len(coverage_from_shipments) > 0:
                 analysis['avg_coverage_from_shipments'] = np.mean(coverage_from_shipments)
                 analysis['median_coverage_from_shipments'] = np.median(coverage_from_shipments)
         